@@ -0,0 +1,152 @@
+import configparser
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+
+class ConfigError(Exception):
+    """
+    Raised when the configuration file is missing a setting or holds an invalid value
+    """
+
+
+@dataclass(frozen=True)
+class BotSettings:
+    """
+    The bot settings that can change while it runs, parsed and validated once per version of the configuration file
+    """
+    hotkey: str
+    window_title: str
+    min_sleep_time: float
+    max_sleep_time: float
+    min_typing_speed: float
+    max_typing_speed: float
+    max_tokens: int
+    model: str
+    time_interval: int
+    stream_messages: bool
+    user_prompts: tuple
+    morning_prompt: str
+    afternoon_prompt: str
+    night_prompt: str
+
+
+def parse_settings(config):
+    """
+    Returns the BotSettings held by a ConfigParser, raising ConfigError if any are missing or invalid
+    """
+    try:
+        settings = BotSettings(
+            hotkey=config.get('Settings', 'hotkey'),
+            window_title=config.get('Settings', 'window_title'),
+            min_sleep_time=config.getfloat('Settings', 'min_sleep_time'),
+            max_sleep_time=config.getfloat('Settings', 'max_sleep_time'),
+            min_typing_speed=config.getfloat('Settings', 'min_typing_speed'),
+            max_typing_speed=config.getfloat('Settings', 'max_typing_speed'),
+            max_tokens=config.getint('Settings', 'max_tokens'),
+            model=config.get('Settings', 'model'),
+            time_interval=config.getint('Settings', 'time_interval'),
+            stream_messages=config.getboolean('Settings', 'stream_messages', fallback=False),
+            user_prompts=tuple(config['user_prompts'].values()),
+            morning_prompt=config.get('system_prompts', 'morning_prompt'),
+            afternoon_prompt=config.get('system_prompts', 'afternoon_prompt'),
+            night_prompt=config.get('system_prompts', 'night_prompt'),
+        )
+    except (configparser.Error, KeyError, ValueError) as e:
+        raise ConfigError(f"Invalid configuration: {str(e)}") from e
+
+    errors = []
+    if not 0 <= settings.min_sleep_time <= settings.max_sleep_time:
+        errors.append('the sleep times must be positive, with the minimum at most the maximum')
+    if not 0 <= settings.min_typing_speed <= settings.max_typing_speed:
+        errors.append('the typing speeds must be positive, with the minimum at most the maximum')
+    if not 0 < settings.max_tokens <= 16:
+        errors.append('max_tokens must be a positive integer less than or equal to 16')
+    if settings.time_interval <= 0:
+        errors.append('time_interval must be a positive integer')
+    if not settings.user_prompts:
+        errors.append('at least one user prompt is needed')
+    if errors:
+        raise ConfigError(f"Invalid configuration: {'; '.join(errors)}")
+    return settings
+
+
+def load_settings(path='config.ini', validate=None):
+    """
+    Reads and validates the configuration file, raising ConfigError if it can't be used.
+    The GUI checks settings with parse_settings before saving them, so both apply the same rules. validate, if
+    given, is called with the parsed settings for checks that need the caller's environment and raises ConfigError
+    """
+    config = configparser.ConfigParser()
+    try:
+        if not config.read(path):
+            raise ConfigError(f"The configuration file {path} could not be read")
+    except configparser.Error as e:
+        raise ConfigError(f"Invalid configuration: {str(e)}") from e
+    settings = parse_settings(config)
+    if validate is not None:
+        validate(settings)
+    return settings
+
+
+class ConfigWatcher:
+    """
+    Holds the current BotSettings and swaps in a new snapshot when the configuration file changes.
+
+    get() checks the file's modification time at most every check_interval seconds, so it is cheap enough to call
+    from the bot loop. A changed file that fails validation is logged and the previous snapshot kept; it is read
+    again on every check until it loads, in case it was caught in the middle of being written. validate is passed
+    on to load_settings, so its checks apply to every snapshot, not just the first.
+    """
+
+    def __init__(self, path='config.ini', check_interval=2, validate=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.validate = validate
+        self.lock = threading.Lock()
+        mtime = self.get_mtime()
+        self.settings = load_settings(path, self.validate)
+        self.mtime = mtime  # Modification time of the file the current snapshot was loaded from
+        self.invalid_mtime = None  # Modification time of the last file that failed validation, logged once
+        self.last_check = time.monotonic()
+
+    def get_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        """
+        Loads the file if it changed since the current snapshot was taken and returns whether the snapshot changed
+        """
+        with self.lock:
+            mtime = self.get_mtime()
+            if mtime is None or mtime == self.mtime:
+                return False
+            try:
+                settings = load_settings(self.path, self.validate)
+            except ConfigError as e:
+                if mtime != self.invalid_mtime:
+                    self.invalid_mtime = mtime
+                    logging.error(f"Keeping the previous settings, the changed configuration file is invalid: {str(e)}")
+                return False
+            self.mtime = mtime
+            self.invalid_mtime = None
+            changed = settings != self.settings
+            self.settings = settings
+        if changed:
+            logging.info("Configuration file changed, using the new settings.")
+        return changed
+
+    def get(self):
+        """
+        Returns the current settings snapshot, reloading it first if the file may have changed
+        """
+        now = time.monotonic()
+        if now - self.last_check >= self.check_interval:
+            self.last_check = now
+            self.reload()
+        return self.settings
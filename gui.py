@@ -1,13 +1,78 @@
+import time
+startup_clock = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox
 import configparser
+import importlib
+import os
+import sys
 import threading
 from ttkthemes import ThemedTk
 import datetime
 import logging
-
-# Import your main script here
-from rs_bot import start_bot, stop_bot, config as bot_config
+from config_snapshot import ConfigError, ConfigWatcher, parse_settings
+from prompt_schedule import PromptSchedule
+
+# Set startup profiling with --profile-startup or RSBOT_PROFILE_STARTUP=1; the time to each startup stage and the
+# import time of each bot dependency are then logged
+PROFILE_STARTUP = '--profile-startup' in sys.argv or os.environ.get('RSBOT_PROFILE_STARTUP') == '1'
+
+# Modules the bot needs, imported in the background once the window is shown, in order, so each import's time
+# covers only what the earlier ones didn't load
+BOT_MODULES = ['openai', 'aiohttp', 'pyautogui', 'pynput.keyboard', 'rs_bot']
+
+# Startup stages as (name, seconds since the GUI started loading)
+startup_times = []
+
+def mark_startup(stage):
+    if PROFILE_STARTUP:
+        startup_times.append((stage, time.perf_counter() - startup_clock))
+
+mark_startup('GUI imports')
+
+# Read the configuration directly; the bot itself is only imported once the window is up
+bot_config = configparser.ConfigParser()
+bot_config.read('config.ini')
+
+# The prompt schedule, computed from the saved settings the same way the bot computes it; created on first use,
+# once the saved configuration is valid
+settings_watcher = None
+prompt_schedule = None
+prompt_timer = None
+
+# The rs_bot module, once loaded
+bot = None
+bot_lock = threading.Lock()
+
+# Function to import the bot and its automation and HTTP dependencies, or return it if already imported
+def load_bot():
+    global bot
+    with bot_lock:
+        if bot is None:
+            for name in BOT_MODULES:
+                import_start = time.perf_counter()
+                module = importlib.import_module(name)
+                if PROFILE_STARTUP:
+                    logging.info(f'Startup profile: import {name} took {(time.perf_counter() - import_start) * 1000:.0f} ms')
+            bot = module
+    return bot
+
+# Function to load the bot in the background so Start doesn't have to wait for it
+def preload_bot():
+    try:
+        load_bot()
+    except (Exception, SystemExit) as e:
+        logging.error(f'Error occurred while loading the bot: {str(e)}')
+
+# Function called once the window is drawn
+def window_shown():
+    mark_startup('Window shown')
+    for stage, seconds in startup_times:
+        logging.info(f'Startup profile: {stage} after {seconds * 1000:.0f} ms')
+    # Show the active prompt and period now rather than waiting for the first Start or Save
+    update_prompt_selection()
+    threading.Thread(target=preload_bot, name='bot-loader', daemon=True).start()
 
 # Create main window
 root = ThemedTk()
@@ -28,6 +93,8 @@ root.resizable(True, True)
 # Configure logging
 logging.basicConfig(filename='runescape_bot.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+mark_startup('Main window created')
+
 def save():
     try:
         config = configparser.ConfigParser()
@@ -56,8 +123,8 @@ def save():
         if not is_float(max_typing_speed):
             error_messages.append('Invalid input: Maximum typing speed must be a positive number.')
 
-        if not max_tokens.isdigit() or int(max_tokens) > 16:
-            error_messages.append('Invalid input: Max tokens must be a positive integer less than or equal to 16.')
+        if not max_tokens.isdigit():
+            error_messages.append('Invalid input: Max tokens must be a positive integer.')
 
         if not time_interval.isdigit():
             error_messages.append('Invalid input: Time interval must be a positive integer.')
@@ -73,14 +140,6 @@ def save():
         max_tokens = int(max_tokens)
         time_interval = int(time_interval)
 
-        if min_sleep_time > max_sleep_time:
-            messagebox.showerror('Error', 'Minimum sleep time cannot be greater than maximum sleep time.')
-            return
-
-        if min_typing_speed > max_typing_speed:
-            messagebox.showerror('Error', 'Minimum typing speed cannot be greater than maximum typing speed.')
-            return
-
         config['Settings']['min_sleep_time'] = str(min_sleep_time)
         config['Settings']['max_sleep_time'] = str(max_sleep_time)
         config['Settings']['min_typing_speed'] = str(min_typing_speed)
@@ -110,12 +169,21 @@ def save():
         config['system_prompts']['afternoon_prompt'] = system_prompt_afternoon_entry.get('1.0', 'end-1c')
         config['system_prompts']['night_prompt'] = system_prompt_night_entry.get('1.0', 'end-1c')
 
-        # Save the config file
-        with open('config.ini', 'w') as configfile:
+        # Check the settings with the same rules the bot applies when it loads them
+        try:
+            parse_settings(config)
+        except ConfigError as e:
+            messagebox.showerror('Error', str(e))
+            return
+
+        # Save the config file; it is written next to the old one and swapped in, so the bot never reads half of it
+        with open('config.ini.tmp', 'w') as configfile:
             config.write(configfile)
+        os.replace('config.ini.tmp', 'config.ini')
 
         messagebox.showinfo('Saved', 'Configuration has been saved!')
         logging.info('Configuration has been saved.')
+        update_prompt_selection()
     except Exception as e:
         messagebox.showerror('Error', f'An error occurred while saving the configuration: {str(e)}')
         logging.error(f'Error occurred while saving configuration: {str(e)}')
@@ -132,13 +200,13 @@ def start():
     try:
         global start_time
         start_time = datetime.datetime.now()
-        threading.Thread(target=start_bot, args=(bot_config,)).start()
+        threading.Thread(target=load_bot().start_bot).start()
         start_button['state'] = 'disabled'
         stop_button['state'] = 'normal'
         update_running_time()
         update_prompt_selection()
         logging.info('Bot started.')
-    except Exception as e:
+    except (Exception, SystemExit) as e:
         messagebox.showerror('Error', f'An error occurred while starting the bot: {str(e)}')
         logging.error(f'Error occurred while starting the bot: {str(e)}')
 
@@ -146,11 +214,11 @@ def start():
 def stop():
     try:
         global start_time
-        stop_bot()
+        if bot is not None:
+            bot.stop_bot()
         stop_button['state'] = 'disabled'
         start_button['state'] = 'normal'
         running_time_label.config(text='Running Time:')
-        prompt_status_value.config(text='')
 
         start_time = None
         logging.info('Bot stopped.')
@@ -173,22 +241,42 @@ def update_running_time():
     except Exception as e:
         logging.error(f'Error occurred while updating running time: {str(e)}')
 
-# Define update prompt selection function
+# Define update prompt selection function, which runs again at the next prompt schedule transition
 def update_prompt_selection():
+    global prompt_timer
     try:
-        current_time = datetime.datetime.utcnow()
-        time_interval = int(bot_config['Settings']['time_interval'])
-        user_prompts = list(bot_config['user_prompts'].keys())
-        prompt_index = (current_time.minute // time_interval) % len(user_prompts)
-        
-        # Change the format from 'prompt_n' to 'Prompt n'
-        prompt_name = f'Prompt {prompt_index + 1}'
-        
-        prompt_status_value.config(text=prompt_name)
-        root.after(200, update_prompt_selection)
+        if prompt_timer is not None:
+            root.after_cancel(prompt_timer)
+        schedule = get_prompt_schedule()
+        if schedule is None:
+            return
+        now = datetime.datetime.utcnow()
+        schedule.update(now)
+        delay = (schedule.next_transition(now) - now).total_seconds()
+        prompt_timer = root.after(int(delay * 1000) + 1, update_prompt_selection)
     except Exception as e:
         logging.error(f'Error occurred while updating prompts: {str(e)}')
 
+# Define the function that shows a new prompt slot
+def show_prompt_slot(slot):
+    # Change the format from 'prompt_n' to 'Prompt n'
+    prompt_status_value.config(text=f'Prompt {slot.prompt_index + 1}')
+    current_time_label.config(text=f'Gameclock ({slot.period.title()}):')
+
+# Function to return the prompt schedule, or None while the saved configuration is invalid
+def get_prompt_schedule():
+    global settings_watcher, prompt_schedule
+    if prompt_schedule is None:
+        try:
+            settings_watcher = ConfigWatcher('config.ini', check_interval=0)
+        except ConfigError as e:
+            logging.error(f'The prompt schedule is unavailable until the configuration is fixed: {str(e)}')
+            prompt_status_value.config(text='')
+            return None
+        prompt_schedule = PromptSchedule(settings_watcher.get)
+        prompt_schedule.subscribe(show_prompt_slot)
+    return prompt_schedule
+
 class Tooltip:
     def __init__(self, widget, text):
         self.widget = widget
@@ -508,21 +596,14 @@ remove_prompt_button = ttk.Button(prompts_frame, text='Remove Prompt', command=r
 add_prompt_button.grid(row=0, column=0, padx=5, pady=5)
 remove_prompt_button.grid(row=0, column=1, padx=5, pady=5)
 
-# Update current time label
+# Update current time label; the game clock is UTC, like the prompt schedule
 def update_current_time():
-    now = datetime.datetime.now()
+    now = datetime.datetime.utcnow()
     current_time = now.strftime("%H:%M:%S")
     current_time_value.config(text=current_time)
-    if 6 <= now.hour < 12:
-        current_time_label.config(text='Gameclock (Morning):')
-    elif 12 <= now.hour < 18:
-        current_time_label.config(text='Gameclock (Afternoon):')
-    else:
-        current_time_label.config(text='Gameclock (Night):')
     root.after(1000, update_current_time)
 
 update_current_time()
-update_prompt_selection()
 
 # Create logging tab
 logging_frame = ttk.Frame(notebook, style='Dark.TFrame')
@@ -553,59 +634,79 @@ clear_button = ttk.Button(logging_frame, text="Clear Log", command=clear_logs)
 clear_button.grid(row=2, column=0, padx=10, pady=5)
 
 # Create text tags for each log level
+LOG_LEVELS = ['INFO', 'DEBUG', 'WARNING', 'ERROR', 'CRITICAL']
 log_output.tag_configure('INFO', foreground='lightgreen')
 log_output.tag_configure('DEBUG', foreground='white')
 log_output.tag_configure('WARNING', foreground='yellow')
 log_output.tag_configure('ERROR', foreground='red')
 log_output.tag_configure('CRITICAL', foreground='red', underline=1)
 
-# Variable to keep track of where we left off in the log file
-last_log_position = 0
+# Log file shown in the Logging tab, and the number of its most recent lines kept in view
+LOG_PATH = 'runescape_bot.log'
+LOG_MAX_LINES = 500
 
-# Function to read and display log file
-def read_log_file():
-    global last_log_position
-    log_output.configure(state='normal')  # Temporarily make the widget editable
-    with open('runescape_bot.log', 'r') as log_file:
-        log_contents = log_file.read()
-        log_output.insert(tk.END, log_contents)
-        last_log_position = log_file.tell()  # Remember where we left off
-    log_output.configure(state='disabled')  # Make the widget read-only again
-    log_output.see(tk.END)  # Scroll to the bottom of the text widget
+# Variables to keep track of where we left off in the log file: the file's identity, so a rotated log is read
+# from the start, the read position, and the last line if it wasn't complete yet
+log_identity = None
+last_log_position = 0
+partial_log_line = ''
 
-def update_log_output():
-    global last_log_position
-    log_output.configure(state='normal')  # Temporarily make the widget editable
-    with open('runescape_bot.log', 'r') as log_file:
+# Function to read the lines appended to the log file since the last read
+def read_new_log_lines():
+    global log_identity, last_log_position, partial_log_line
+    try:
+        stat = os.stat(LOG_PATH)
+    except OSError:
+        return []
+    identity = (stat.st_dev, stat.st_ino)
+    if identity != log_identity or stat.st_size < last_log_position:
+        # The log was rotated or truncated, start over from its beginning
+        log_identity = identity
+        last_log_position = 0
+        partial_log_line = ''
+    if stat.st_size == last_log_position:
+        return []
+    with open(LOG_PATH, 'r', errors='replace') as log_file:
         log_file.seek(last_log_position)  # Jump to where we left off
-        new_logs = log_file.read()  # Read and append new logs
-        log_output.insert(tk.END, new_logs)
-        # If the text widget is too filled, remove the oldest logs
-        if int(log_output.index('end-1c').split('.')[0]) > 500:
-            log_output.delete('1.0', '2.0')  # Remove the first line
+        new_logs = partial_log_line + log_file.read()
         last_log_position = log_file.tell()  # Remember where we left off
+    lines = new_logs.split('\n')
+    partial_log_line = lines.pop()
+    return lines
 
-        # Apply tags to new logs based on log level
-        for tag in ['INFO', 'DEBUG', 'WARNING', 'ERROR', 'CRITICAL']:
-            start_index = '1.0'
-            while True:
-                start_index = log_output.search(tag, start_index, stopindex=tk.END)
-                if not start_index:
-                    break
-                end_index = f'{start_index.split(".")[0]}.{int(start_index.split(".")[1]) + len(tag)}'
-                log_output.tag_add(tag, start_index, end_index)
-                start_index = end_index
-
+# Function to append log lines, tagging each line's level as it is inserted and dropping the oldest lines
+def append_log_lines(lines):
+    if not lines:
+        return
+    at_bottom = log_scrollbar.get()[1] == 1.0  # Only follow new lines if the view is already at the bottom
+    log_output.configure(state='normal')  # Temporarily make the widget editable
+    for line in lines[-LOG_MAX_LINES:]:
+        positions = [(line.find(level), level) for level in LOG_LEVELS if level in line]
+        if positions:
+            position, level = min(positions)
+            log_output.insert(tk.END, line[:position], (), level, (level,), line[position + len(level):] + '\n', ())
+        else:
+            log_output.insert(tk.END, line + '\n')
+    line_count = int(log_output.index('end-1c').split('.')[0]) - 1
+    if line_count > LOG_MAX_LINES:
+        log_output.delete('1.0', f'{line_count - LOG_MAX_LINES + 1}.0')  # Remove the oldest lines
     log_output.configure(state='disabled')  # Make the widget read-only again
-    # Scroll to the bottom of the text widget if the scrollbar is at the bottom
-    scrollbar_position = log_scrollbar.get()[1]
-    if scrollbar_position == 1.0:
+    if at_bottom:
         log_output.see(tk.END)
+
+def update_log_output():
+    try:
+        append_log_lines(read_new_log_lines())
+    except Exception as e:
+        logging.error(f'Error occurred while updating the log output: {str(e)}')
     root.after(1000, update_log_output)
 
 # Initial log file read
-read_log_file()
+append_log_lines(read_new_log_lines())
+log_output.see(tk.END)  # Scroll to the bottom of the text widget
 root.after(1000, update_log_output)  # Start log update loop
 
 root.configure(background='#303030',)
+mark_startup('Widgets built')
+root.after_idle(window_shown)
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of chat completions keyed by model, system prompt, user prompt and max_tokens.
+
+    Several completions are kept per key so repeated prompt slots don't always send the same message. A key is
+    only served from the cache once it holds completions_per_key entries; until then the caller should ask the
+    API and add the result. Entries expire after ttl seconds, and the least recently used entries are evicted
+    once the cache holds more than max_entries completions.
+    """
+
+    def __init__(self, path='llm_cache.sqlite3', ttl=86400, max_entries=1000, completions_per_key=5):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.completions_per_key = completions_per_key
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS completions ('
+                'id INTEGER PRIMARY KEY, key TEXT NOT NULL, content TEXT NOT NULL, '
+                'created_at REAL NOT NULL, last_used REAL NOT NULL)'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS completions_key ON completions (key)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)')
+
+    @staticmethod
+    def make_key(model, system_prompt, user_prompt, max_tokens):
+        request = json.dumps([model, system_prompt, user_prompt, max_tokens])
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def get(self, model, system_prompt, user_prompt, max_tokens):
+        """
+        Returns a random cached completion for the request, or None if the key isn't full yet
+        """
+        key = self.make_key(model, system_prompt, user_prompt, max_tokens)
+        now = time.time()
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT id, content FROM completions WHERE key = ? AND created_at > ?',
+                (key, now - self.ttl)
+            ).fetchall()
+            if len(rows) < self.completions_per_key:
+                return None
+            entry_id, content = random.choice(rows)
+            with self.connection:
+                self.connection.execute('UPDATE completions SET last_used = ? WHERE id = ?', (now, entry_id))
+            return content
+
+    def add(self, model, system_prompt, user_prompt, max_tokens, content):
+        """
+        Stores a completion for the request and evicts expired and least recently used entries
+        """
+        key = self.make_key(model, system_prompt, user_prompt, max_tokens)
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT INTO completions (key, content, created_at, last_used) VALUES (?, ?, ?, ?)',
+                (key, content, now, now)
+            )
+            self.connection.execute('DELETE FROM completions WHERE created_at <= ?', (now - self.ttl,))
+            self.connection.execute(
+                'DELETE FROM completions WHERE id IN ('
+                'SELECT id FROM completions ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,241 @@
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+
+import aiohttp
+import openai
+
+from llm_metrics import LLMMetrics
+from mock_llm_server import MockLLMServer
+from resilience import CircuitBreaker, call_with_retry
+
+# Seconds a blocking call waits between checks of its stop event
+POLL_INTERVAL = 0.2
+
+
+class LLMCancelled(Exception):
+    """
+    Raised when a request is abandoned because the bot is stopping
+    """
+
+
+class LLMClient:
+    """
+    Runs chat completion requests on a background asyncio loop that shares one keep-alive HTTP session.
+
+    Requests can be awaited from async code with acreate(), or made from the bot threads with create(),
+    which waits in short slices so a stop event can cancel a request that is still in flight. create() retries
+    transient errors with backoff and stops calling the API while its circuit breaker is open. stream() does the
+    same for a streaming request and returns its content as it arrives. api_key and api_base select the endpoint;
+    when they are None the global openai settings are used.
+    """
+
+    def __init__(self, timeout=30, max_connections=4, api_key=None, api_base=None, retry_attempts=4,
+                 retry_base_delay=1, retry_max_delay=30, breaker=None):
+        self.timeout = timeout
+        self.api_key = api_key
+        self.api_base = api_base
+        self.max_connections = max_connections
+        self.server = None  # Mock server owned by this client, stopped on close
+        self.metrics = LLMMetrics()
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the background event loop if it isn't running yet
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='llm-client', daemon=True)
+                self.thread.start()
+        return self.loop
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def prepare(self, kwargs):
+        """
+        Points openai at the shared session and fills in the client's endpoint settings
+        """
+        openai.aiosession.set(await self.get_session())
+        if self.api_key is not None:
+            kwargs.setdefault('api_key', self.api_key)
+        if self.api_base is not None:
+            kwargs.setdefault('api_base', self.api_base)
+
+    async def acreate(self, **kwargs):
+        """
+        Sends a chat completion request over the shared session and returns the response.
+
+        The call's latency, token usage and error class are recorded in self.metrics.
+        """
+        await self.prepare(kwargs)
+        model = kwargs.get('model', 'unknown')
+        start_time = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(openai.ChatCompletion.acreate(request_timeout=self.timeout, **kwargs),
+                                              self.timeout)
+        except (Exception, asyncio.CancelledError) as e:
+            self.metrics.record(model, time.perf_counter() - start_time, error=e)
+            raise
+        self.metrics.record(model, time.perf_counter() - start_time, usage=response.get('usage'))
+        return response
+
+    def submit(self, **kwargs):
+        """
+        Schedules a chat completion request and returns a concurrent.futures.Future for its response
+        """
+        return asyncio.run_coroutine_threadsafe(self.acreate(**kwargs), self.start())
+
+    def create(self, stop_event=None, **kwargs):
+        """
+        Sends a chat completion request, retrying transient errors, and blocks until it succeeds, fails for good
+        or stop_event is set
+        """
+        return call_with_retry(lambda: self.create_once(stop_event, **kwargs), self.retry_attempts,
+                               self.retry_base_delay, self.retry_max_delay, self.breaker, stop_event,
+                               description='LLM request')
+
+    def create_once(self, stop_event=None, **kwargs):
+        """
+        Sends a single chat completion request and blocks until it completes, times out or stop_event is set
+        """
+        future = self.submit(**kwargs)
+        while True:
+            done, _ = concurrent.futures.wait([future], timeout=POLL_INTERVAL)
+            if done:
+                return future.result()
+            if stop_event is not None and stop_event.is_set():
+                future.cancel()
+                raise LLMCancelled("The request was cancelled because the bot is stopping")
+
+    async def astream(self, output, **kwargs):
+        """
+        Sends a streaming chat completion request and puts each content delta on the output queue, followed by
+        None when the stream ends or by the exception that ended it.
+
+        The whole stream is recorded in self.metrics, counting one completion token per chunk.
+        """
+        await self.prepare(kwargs)
+        model = kwargs.get('model', 'unknown')
+        start_time = time.perf_counter()
+        chunks = 0
+        try:
+            response = await asyncio.wait_for(
+                openai.ChatCompletion.acreate(stream=True, request_timeout=self.timeout, **kwargs), self.timeout)
+            async for chunk in response:
+                delta = chunk['choices'][0].get('delta', {}).get('content')
+                if delta:
+                    chunks += 1
+                    output.put(delta)
+        except asyncio.CancelledError as e:
+            self.metrics.record(model, time.perf_counter() - start_time, error=e)
+            raise
+        except Exception as e:
+            self.metrics.record(model, time.perf_counter() - start_time, error=e)
+            output.put(e)
+            return
+        self.metrics.record(model, time.perf_counter() - start_time, usage={'completion_tokens': chunks})
+        output.put(None)
+
+    def stream(self, stop_event=None, **kwargs):
+        """
+        Sends a streaming chat completion request and returns an iterator over its content deltas.
+
+        Blocks until the first delta arrives, so errors before then are retried like in create(); an error
+        later in the stream is raised from the iterator. Setting stop_event cancels the request.
+        """
+        return call_with_retry(lambda: self.stream_once(stop_event, **kwargs), self.retry_attempts,
+                               self.retry_base_delay, self.retry_max_delay, self.breaker, stop_event,
+                               description='LLM stream')
+
+    def stream_once(self, stop_event=None, **kwargs):
+        output = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self.astream(output, **kwargs), self.start())
+        first = self.next_delta(output, future, stop_event)
+
+        def deltas():
+            delta = first
+            while delta is not None:
+                yield delta
+                delta = self.next_delta(output, future, stop_event)
+
+        return deltas()
+
+    def next_delta(self, output, future, stop_event):
+        """
+        Returns the next content delta of a stream, or None at its end
+        """
+        while True:
+            try:
+                delta = output.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if stop_event is not None and stop_event.is_set():
+                    future.cancel()
+                    raise LLMCancelled("The request was cancelled because the bot is stopping")
+                continue
+            if isinstance(delta, Exception):
+                raise delta
+            return delta
+
+    def close(self):
+        """
+        Closes the shared session and stops the background event loop
+        """
+        with self.lock:
+            loop = self.loop
+            self.loop = None
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+        if loop is None:
+            return
+        if self.session is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.session.close(), loop).result(timeout=5)
+            except Exception as e:
+                logging.error(f"An error occurred while closing the HTTP session: {str(e)}")
+            self.session = None
+        loop.call_soon_threadsafe(loop.stop)
+        self.thread.join(timeout=5)
+        if not self.thread.is_alive():
+            loop.close()
+
+
+def create_llm_client(backend='openai', timeout=30, api_key=None, api_base=None,
+                      mock_latency=0.5, mock_error_rate=0.0, mock_seed=0, **client_options):
+    """
+    Creates an LLM client for the selected backend.
+
+    'openai' talks to the OpenAI API, 'local' to any OpenAI-compatible endpoint at api_base, and 'mock' starts
+    a deterministic mock server in-process with the given latency and error rate. Other keyword arguments,
+    such as the retry settings, are passed on to LLMClient.
+    """
+    if backend == 'openai':
+        return LLMClient(timeout=timeout, api_key=api_key, **client_options)
+    if backend == 'local':
+        if not api_base:
+            raise ValueError("The local LLM backend needs an API base URL")
+        # OpenAI-compatible servers usually ignore the key, but the openai library insists on one
+        return LLMClient(timeout=timeout, api_key=api_key or 'local', api_base=api_base, **client_options)
+    if backend == 'mock':
+        server = MockLLMServer(latency=mock_latency, error_rate=mock_error_rate, seed=mock_seed).start()
+        client = LLMClient(timeout=timeout, api_key='mock', api_base=server.url, **client_options)
+        client.server = server
+        return client
+    raise ValueError(f"Unknown LLM backend: {backend}")
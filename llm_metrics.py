@@ -0,0 +1,128 @@
+import bisect
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+# Upper bounds in seconds of the latency histogram buckets; the last bucket catches everything slower
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16, 32]
+
+# Upper bounds of the token count histogram buckets
+TOKEN_BUCKETS = [8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+class ModelStats:
+    """
+    Counters and histograms for the calls made to one model
+    """
+
+    def __init__(self, sample_size):
+        self.calls = 0
+        self.errors = Counter()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.completion_token_histogram = [0] * (len(TOKEN_BUCKETS) + 1)
+        self.latencies = deque(maxlen=sample_size)  # Recent latencies, for percentiles
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def snapshot(self):
+        successes = self.calls - sum(self.errors.values())
+        return {
+            'calls': self.calls,
+            'errors': dict(self.errors),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'avg_completion_tokens': self.completion_tokens / successes if successes else None,
+            'latency_p50': self.percentile(0.5),
+            'latency_p90': self.percentile(0.9),
+            'latency_p99': self.percentile(0.99),
+            'latency_histogram': dict(zip([f"<={bound}s" for bound in LATENCY_BUCKETS] + ['slower'],
+                                          self.latency_histogram)),
+            'completion_token_histogram': dict(zip([f"<={bound}" for bound in TOKEN_BUCKETS] + ['more'],
+                                                   self.completion_token_histogram)),
+        }
+
+
+class LLMMetrics:
+    """
+    Records latency, token usage and errors of every LLM call, aggregated per model.
+
+    snapshot() can be queried at any time; start_reporter() logs a summary periodically.
+    """
+
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self.models = {}
+        self.lock = threading.Lock()
+        self.reporter = None
+        self.calls_at_last_report = 0
+
+    def record(self, model, latency, usage=None, error=None):
+        """
+        Records one call; usage is the response's usage object and error the exception it raised, if any
+        """
+        with self.lock:
+            stats = self.models.get(model)
+            if stats is None:
+                stats = self.models[model] = ModelStats(self.sample_size)
+            stats.calls += 1
+            stats.latencies.append(latency)
+            stats.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            if error is not None:
+                stats.errors[type(error).__name__] += 1
+            if usage:
+                completion_tokens = usage.get('completion_tokens', 0)
+                stats.prompt_tokens += usage.get('prompt_tokens', 0)
+                stats.completion_tokens += completion_tokens
+                stats.completion_token_histogram[bisect.bisect_left(TOKEN_BUCKETS, completion_tokens)] += 1
+
+    def snapshot(self):
+        """
+        Returns the current counters and histograms for every model
+        """
+        with self.lock:
+            return {model: stats.snapshot() for model, stats in self.models.items()}
+
+    def summary(self):
+        """
+        Returns a one-line summary per model
+        """
+        lines = []
+        for model, stats in self.snapshot().items():
+            percentiles = '/'.join('-' if value is None else f"{value:.2f}"
+                                   for value in (stats['latency_p50'], stats['latency_p90'], stats['latency_p99']))
+            errors = ', '.join(f"{name}={count}" for name, count in stats['errors'].items()) or 'none'
+            lines.append(f"{model}: {stats['calls']} calls, latency p50/p90/p99 {percentiles}s, "
+                         f"tokens {stats['prompt_tokens']} prompt / {stats['completion_tokens']} completion, "
+                         f"errors {errors}")
+        return '\n'.join(lines)
+
+    def report(self):
+        with self.lock:
+            total_calls = sum(stats.calls for stats in self.models.values())
+            if total_calls == self.calls_at_last_report:
+                return
+            self.calls_at_last_report = total_calls
+        for line in self.summary().splitlines():
+            logging.info(f"LLM metrics: {line}")
+
+    def start_reporter(self, interval):
+        """
+        Logs a summary every interval seconds, skipping intervals without new calls
+        """
+        if self.reporter is not None or interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.report()
+
+        self.reporter = threading.Thread(target=run, name='llm-metrics', daemon=True)
+        self.reporter.start()
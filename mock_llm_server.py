@@ -0,0 +1,210 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, for running the bots offline in load tests and benchmarks.
+
+Responses are deterministic for a given request, and injected errors follow a fixed sequence for a given seed.
+It can run inside a bot (llm_backend = mock) or on its own, with the bots pointed at it as a local endpoint:
+
+    python mock_llm_server.py --port 8765 --latency 0.5 --error-rate 0.1
+"""
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned replies the mock server picks from
+MOCK_REPLIES = [
+    "Anyone up for a Barrows run?",
+    "Just hit 99 fishing, lobsters for all!",
+    "Who else is stuck on Desert Treasure?",
+    "Buying gf, selling bad jokes.",
+    "The Wise Old Man knows too much.",
+    "Grand Exchange prices are wild today.",
+    "Nothing beats a quiet afternoon of woodcutting.",
+    "Guthix sleeps, but I don't.",
+]
+
+# Seconds between the chunks of a streamed response
+MOCK_CHUNK_INTERVAL = 0.02
+
+# Errors the mock server can inject, as (status, error type, message)
+MOCK_ERRORS = [
+    (429, 'rate_limit_error', 'Rate limit reached for requests'),
+    (500, 'server_error', 'The server had an error while processing your request'),
+    (503, 'server_error', 'The engine is currently overloaded'),
+]
+
+
+class MockLLMServer:
+    """
+    Serves /v1/chat/completions with a configurable latency and rate of injected errors.
+
+    Requests with stream set get the first choice back as server-sent events, one word per chunk.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.5, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def should_fail(self):
+        with self.lock:
+            if self.random.random() >= self.error_rate:
+                return None
+            return self.random.choice(MOCK_ERRORS)
+
+    def complete(self, request):
+        """
+        Returns a chat completion response body for a request body
+        """
+        messages = request.get('messages', [])
+        prompt = json.dumps(messages, sort_keys=True)
+        seed = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+        choices = []
+        completion_tokens = 0
+        for index in range(request.get('n', 1)):
+            content = MOCK_REPLIES[(seed + index) % len(MOCK_REPLIES)]
+            completion_tokens += len(content.split())
+            choices.append({
+                'index': index,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            })
+        prompt_tokens = sum(len(str(message.get('content', '')).split()) for message in messages)
+        return {
+            'id': f"chatcmpl-mock-{seed % 10 ** 12}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': choices,
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        }
+
+    def stream_chunks(self, request):
+        """
+        Yields the chat.completion.chunk bodies of a streamed response for a request body
+        """
+        response = self.complete(dict(request, n=1))
+        content = response['choices'][0]['message']['content']
+        words = content.split(' ')
+        deltas = [{'role': 'assistant'}] + [{'content': word if i == 0 else ' ' + word} for i, word in enumerate(words)]
+        for i, delta in enumerate(deltas + [{}]):
+            yield {
+                'id': response['id'],
+                'object': 'chat.completion.chunk',
+                'created': response['created'],
+                'model': response['model'],
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': 'stop' if i == len(deltas) else None}],
+            }
+
+    def make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep connections alive like the real API
+
+            def send_json(self, status, body, headers=None):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_stream(self, request):
+                # Without a Content-Length the end of the stream is marked by closing the connection
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for chunk in mock.stream_chunks(request):
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    time.sleep(MOCK_CHUNK_INTERVAL)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self.send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+                    return
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self.send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+                    return
+
+                time.sleep(mock.latency)
+                error = mock.should_fail()
+                if error is not None:
+                    status, error_type, message = error
+                    headers = {'Retry-After': '1'} if status == 429 else None
+                    self.send_json(status, {'error': {'message': message, 'type': error_type}}, headers)
+                    return
+                if request.get('stream'):
+                    self.send_stream(request)
+                else:
+                    self.send_json(200, mock.complete(request))
+
+            def log_message(self, format, *args):
+                logging.debug(f"Mock LLM server: {format % args}")
+
+        return Handler
+
+    def start(self):
+        """
+        Serves requests on a background thread
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mock-llm-server', daemon=True)
+        self.thread.start()
+        logging.info(f"Mock LLM server listening on {self.url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local mock of the OpenAI chat completions API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds to wait before each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the injected error sequence')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = MockLLMServer(args.host, args.port, args.latency, args.error_rate, args.seed)
+    logging.info(f"Mock LLM server listening on {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Mock LLM server stopped")
+    finally:
+        server.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
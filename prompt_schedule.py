@@ -0,0 +1,97 @@
+import datetime
+import logging
+from dataclasses import dataclass
+
+# UTC hour at which each system prompt period starts, in order
+PERIOD_STARTS = [(6, 'morning'), (12, 'afternoon'), (18, 'night')]
+
+
+@dataclass(frozen=True)
+class PromptSlot:
+    """
+    The prompts active between two schedule transitions
+    """
+    prompt_index: int
+    period: str
+    user_prompt: str
+    system_prompt: str
+
+
+def get_period(hour):
+    """
+    Returns the system prompt period ('morning', 'afternoon' or 'night') of a UTC hour
+    """
+    period = 'night'
+    for start_hour, name in PERIOD_STARTS:
+        if hour >= start_hour:
+            period = name
+    return period
+
+
+class PromptSchedule:
+    """
+    Timetable of the user prompt rotation and the system prompt periods, shared by the bot and the GUI.
+
+    The user prompt rotates every time_interval minutes, restarting at each hour, and the system prompt follows
+    the morning, afternoon and night periods in UTC. The timetable for an hour is compiled once per settings
+    snapshot; update() notifies subscribers only when the active slot changes, and next_transition() tells
+    callers when to check again.
+    """
+
+    def __init__(self, get_settings):
+        self.get_settings = get_settings
+        self.subscribers = []
+        self.current = None
+        self.compiled_for = None
+        self.minute_slots = ()  # Prompt index for each minute of the hour
+        self.hour_periods = tuple(get_period(hour) for hour in range(24))
+
+    def compile(self, settings):
+        if settings is not self.compiled_for:
+            prompt_count = len(settings.user_prompts)
+            self.minute_slots = tuple((minute // settings.time_interval) % prompt_count for minute in range(60))
+            self.compiled_for = settings
+        return settings
+
+    def slot_at(self, when, settings=None):
+        """
+        Returns the PromptSlot active at a UTC time
+        """
+        settings = self.compile(settings if settings is not None else self.get_settings())
+        prompt_index = self.minute_slots[when.minute]
+        period = self.hour_periods[when.hour]
+        system_prompt = getattr(settings, f'{period}_prompt')
+        return PromptSlot(prompt_index, period, settings.user_prompts[prompt_index], system_prompt)
+
+    def next_transition(self, when, settings=None):
+        """
+        Returns the UTC time at which the slot active at when next changes
+        """
+        settings = self.compile(settings if settings is not None else self.get_settings())
+        key = (self.minute_slots[when.minute], self.hour_periods[when.hour])
+        transition = when.replace(second=0, microsecond=0)
+        for _ in range(24 * 60):
+            transition += datetime.timedelta(minutes=1)
+            if (self.minute_slots[transition.minute], self.hour_periods[transition.hour]) != key:
+                break
+        return transition
+
+    def subscribe(self, callback):
+        """
+        Registers callback(slot) to be called from update() whenever the active slot changes
+        """
+        self.subscribers.append(callback)
+
+    def update(self, now=None):
+        """
+        Returns the slot active now, notifying the subscribers first if it changed since the last update
+        """
+        slot = self.slot_at(now if now is not None else datetime.datetime.utcnow())
+        if slot != self.current:
+            self.current = slot
+            for callback in self.subscribers:
+                try:
+                    callback(slot)
+                except Exception as e:
+                    logging.error(f"An error occurred while notifying a prompt schedule subscriber: {str(e)}")
+        return slot
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import aiohttp
+import openai
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is refused because its circuit breaker is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service after failure_threshold consecutive transient failures.
+
+    Once open, calls are refused until reset_timeout seconds have passed; then a single probe call is let
+    through, and its outcome closes the circuit again or reopens it for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a call may be made now
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.probing = True
+            logging.info("Circuit breaker half-open, probing the service.")
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info("Circuit breaker closed, the service has recovered.")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logging.warning(f"Circuit breaker open after {self.failures} failures, "
+                                f"pausing calls for {self.reset_timeout} seconds.")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def record_other(self):
+        """
+        Records an outcome that says nothing about the service's health, such as a rejected request
+        """
+        with self.lock:
+            self.probing = False
+
+
+def is_transient(error):
+    """
+    Returns whether an error is worth retrying: rate limits, server errors, timeouts and connection problems
+    """
+    if isinstance(error, (openai.error.RateLimitError, openai.error.Timeout, openai.error.APIConnectionError,
+                          openai.error.ServiceUnavailableError, openai.error.TryAgain,
+                          asyncio.TimeoutError, aiohttp.ClientError)):
+        return True
+    if isinstance(error, openai.error.APIError):
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+
+def get_retry_after(error):
+    """
+    Returns the Retry-After delay in seconds sent with an error, or None
+    """
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Returns the delay before retry number attempt (starting at 0): exponential, capped and jittered
+    """
+    delay = min(max_delay, base_delay * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def call_with_retry(func, attempts=4, base_delay=1, max_delay=30, breaker=None, stop_event=None,
+                    is_retryable=is_transient, description='call'):
+    """
+    Calls func, retrying retryable errors with exponential backoff, jitter and any Retry-After the error carries.
+
+    With a breaker, calls are refused with CircuitOpenError while it is open and every outcome is reported to it.
+    Waits between attempts end early when stop_event is set, in which case the last error is raised.
+    """
+    for attempt in range(attempts):
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"The {description} is paused after repeated failures")
+        try:
+            result = func()
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None:
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_other()
+            if not retryable or attempt == attempts - 1:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, max_delay))
+            logging.warning(f"The {description} failed ({type(e).__name__}: {str(e)}), "
+                            f"retrying in {delay:.1f} seconds.")
+            if stop_event is not None:
+                if stop_event.wait(delay):
+                    raise
+            else:
+                time.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
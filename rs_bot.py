@@ -9,6 +9,12 @@ import logging
 import configparser
 from collections import deque
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import LLMCancelled, create_llm_client
+from llm_cache import ResponseCache
+from resilience import CircuitBreaker, backoff_delay, call_with_retry
+from config_snapshot import ConfigError, ConfigWatcher
+from prompt_schedule import PromptSchedule
 
 # Read configuration file
 config = configparser.ConfigParser()
@@ -21,22 +27,39 @@ except configparser.Error as e:
 # Setup logging
 logging.basicConfig(filename='runescape_bot.log', level=logging.INFO)
 
-# Variables from configuration file
+# Function to reject settings whose hotkey isn't a key pynput can press
+def check_hotkey(settings):
+    if settings.hotkey not in Key.__members__:
+        raise ConfigError(f"Invalid configuration: unknown hotkey '{settings.hotkey}'")
+
+# Settings the bot reads on every message; saving config.ini takes effect without restarting the bot
+try:
+    settings_watcher = ConfigWatcher('config.ini', validate=check_hotkey)
+except ConfigError as e:
+    logging.error(f"An error occurred while reading the configuration file: {str(e)}")
+    sys.exit(1)
+
+# Variables from configuration file, read once at startup
 try:
-    hotkey = Key[config.get('Settings', 'hotkey')]
-    window_title = config.get('Settings', 'window_title')
-    min_sleep_time = config.getfloat('Settings', 'min_sleep_time')
-    max_sleep_time = config.getfloat('Settings', 'max_sleep_time')
-    min_typing_speed = config.getfloat('Settings', 'min_typing_speed')
-    max_typing_speed = config.getfloat('Settings', 'max_typing_speed')
     openai.api_key = config.get('Settings', 'openai_api_key')
-    max_tokens = config.getint('Settings', 'max_tokens')
-    model = config.get('Settings', 'model')
-    prompt_1 = config.get('user_prompts', 'prompt_1')
-    prompt_2 = config.get('user_prompts', 'prompt_2')
-    system_prompt_morning = config.get('system_prompts', 'morning_prompt')
-    system_prompt_afternoon = config.get('system_prompts', 'afternoon_prompt')
-    system_prompt_night = config.get('system_prompts', 'night_prompt')
+    request_timeout = config.getfloat('Settings', 'request_timeout', fallback=30)
+    llm_backend = config.get('Settings', 'llm_backend', fallback='openai')
+    llm_api_base = config.get('Settings', 'llm_api_base', fallback='')
+    mock_latency = config.getfloat('Settings', 'mock_latency', fallback=0.5)
+    mock_error_rate = config.getfloat('Settings', 'mock_error_rate', fallback=0.0)
+    metrics_interval = config.getfloat('Settings', 'metrics_interval', fallback=300)
+    retry_attempts = config.getint('Settings', 'retry_attempts', fallback=4)
+    retry_base_delay = config.getfloat('Settings', 'retry_base_delay', fallback=1)
+    retry_max_delay = config.getfloat('Settings', 'retry_max_delay', fallback=30)
+    breaker_failure_threshold = config.getint('Settings', 'breaker_failure_threshold', fallback=5)
+    breaker_reset_timeout = config.getfloat('Settings', 'breaker_reset_timeout', fallback=30)
+    prepared_message_ttl = config.getfloat('Settings', 'prepared_message_ttl', fallback=300)
+    completions_per_request = config.getint('Settings', 'completions_per_request', fallback=5)
+    pool_low_water = config.getint('Settings', 'pool_low_water', fallback=1)
+    cache_path = config.get('Settings', 'cache_path', fallback='llm_cache.sqlite3')
+    cache_ttl = config.getfloat('Settings', 'cache_ttl', fallback=86400)
+    cache_max_entries = config.getint('Settings', 'cache_max_entries', fallback=1000)
+    cache_completions_per_key = config.getint('Settings', 'cache_completions_per_key', fallback=5)
 except configparser.Error as e:
     logging.error(f"An error occurred while reading a setting from the configuration file: {str(e)}")
     sys.exit(1)
@@ -52,14 +75,28 @@ effects = [
     'glow1:wave:', 'glow2:wave:', 'glow3:wave:'
 ]
 
+# Message sent when a completion has no content
+FALLBACK_MESSAGE = "Join the FriendchatRS FC!"
+
 keyboard = Controller()
 stop_event = threading.Event()
+llm_client = create_llm_client(llm_backend, request_timeout, openai.api_key, llm_api_base,
+                               mock_latency, mock_error_rate, retry_attempts=retry_attempts,
+                               retry_base_delay=retry_base_delay, retry_max_delay=retry_max_delay,
+                               breaker=CircuitBreaker(breaker_failure_threshold, breaker_reset_timeout))
+llm_client.metrics.start_reporter(metrics_interval)
+prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+response_cache = ResponseCache(cache_path, cache_ttl, cache_max_entries, cache_completions_per_key)
+prompt_schedule = PromptSchedule(settings_watcher.get)
+prompt_schedule.subscribe(lambda slot: logging.info(f"Prompt slot changed to prompt {slot.prompt_index + 1}, "
+                                                    f"{slot.period} system prompt."))
 
 def press_hotkey():
     """
     Simulates pressing and releasing a hotkey
     """
     try:
+        hotkey = Key[settings_watcher.get().hotkey]
         keyboard.press(hotkey)
         keyboard.release(hotkey)
         time.sleep(1)
@@ -68,8 +105,11 @@ def press_hotkey():
 
 def type_message(message):
     """
-    Types out a message character by character with simulated delay between keypresses
+    Types out a message character by character with simulated delay between keypresses and returns what was typed.
+    The message can be a string or an iterator of characters that are still arriving, such as a streamed message
     """
+    settings = settings_watcher.get()
+    typed = []
     try:
         for char in message:
             if stop_event.is_set():  # Check if the stop event has been signaled
@@ -77,11 +117,13 @@ def type_message(message):
                 break
             keyboard.press(char)
             keyboard.release(char)
-            time.sleep(random.uniform(min_typing_speed, max_typing_speed))
+            typed.append(char)
+            time.sleep(random.uniform(settings.min_typing_speed, settings.max_typing_speed))
         keyboard.press(Key.enter)
         keyboard.release(Key.enter)
     except Exception as e:
         logging.error(f"An error occurred while typing the message: {str(e)}")
+    return ''.join(typed)
 
 def get_runescape_windows():
     """
@@ -97,15 +139,76 @@ def get_runescape_windows():
         logging.error(f"An error occurred while trying to focus on the window: {str(e)}")
         raise e
 
-def generate_message(user_prompt, system_prompt):
+def post_process(message):
     """
-    Generates a message based on the current UTC time using GPT-3
+    Turns a raw completion into a chat message with a random effect prefix and only ASCII characters
+    """
+    message = (message or '').strip('"').encode('ascii', 'ignore').decode('ascii')
+    if not message:
+        message = FALLBACK_MESSAGE
+    effect = random.choice(effects)
+    return f"{effect} {message}"
+
+def post_process_stream(deltas):
+    """
+    Yields the characters of a chat message as completion deltas arrive, applying the same steps as post_process.
+    A stream without content gets the fallback message
+    """
+    yield from f"{random.choice(effects)} "
+    started = False
+    sent = False
+    held_quotes = ''  # Quotes are only typed once something other than a quote follows them
+    for delta in deltas:
+        for char in delta:
+            if char == '"':
+                if started:
+                    held_quotes += char
+                continue
+            started = True
+            for pending in held_quotes + char:
+                if pending.isascii():
+                    sent = True
+                    yield pending
+            held_quotes = ''
+    if not sent:
+        # Nothing typeable arrived, so send the fallback message rather than an effect prefix on its own
+        yield from FALLBACK_MESSAGE
+
+def record_stream(deltas, settings, user_prompt, system_prompt):
+    """
+    Passes the deltas of a streamed completion through and caches the completion once the stream has ended
+    """
+    completion = []
+    try:
+        for delta in deltas:
+            completion.append(delta)
+            yield delta
+    except LLMCancelled:
+        logging.info("Message streaming cancelled because the bot is stopping.")
+        return
+    except Exception as e:
+        logging.error(f"An error occurred while streaming the message: {str(e)}")
+        return
+    if completion:
+        response_cache.add(settings.model, system_prompt, user_prompt, settings.max_tokens, ''.join(completion))
+
+def stream_message(user_prompt, system_prompt):
+    """
+    Starts generating a message and returns an iterator over its characters once the first token has arrived,
+    or None if the request failed
     """
     logging.info(f"Current UTC time: {datetime.datetime.utcnow().isoformat()}")
-    
+
+    settings = settings_watcher.get()
     try:
-        response = openai.ChatCompletion.create(
-            model=model,
+        cached = response_cache.get(settings.model, system_prompt, user_prompt, settings.max_tokens)
+        if cached is not None:
+            logging.info("Using a cached completion.")
+            return post_process_stream([cached])
+
+        deltas = llm_client.stream(
+            stop_event=stop_event,
+            model=settings.model,
             messages=[
                 {
                     "role": "system",
@@ -116,23 +219,202 @@ def generate_message(user_prompt, system_prompt):
                     "content": user_prompt,
                 },
             ],
-            max_tokens=max_tokens
+            max_tokens=settings.max_tokens
         )
-        message = response['choices'][0]['message']['content']
+        return post_process_stream(record_stream(deltas, settings, user_prompt, system_prompt))
+    except LLMCancelled:
+        logging.info("Message generation cancelled because the bot is stopping.")
+        return None
+    except Exception as e:
+        logging.error(f"An error occurred while generating the message: {str(e)}")
+        return None
+
+def request_completions(user_prompt, system_prompt, model, max_tokens):
+    """
+    Returns raw completions for the prompts, from the cache once it is full or else from one API call with n choices
+    """
+    # Serve repeated prompt slots from the cache once it holds enough completions for them
+    cached = response_cache.get(model, system_prompt, user_prompt, max_tokens)
+    if cached is not None:
+        logging.info("Using a cached completion.")
+        return [cached]
+
+    response = llm_client.create(
+        stop_event=stop_event,
+        model=model,
+        messages=[
+            {
+                "role": "system",
+                "content": system_prompt,
+            },
+            {
+                "role": "user",
+                "content": user_prompt,
+            },
+        ],
+        max_tokens=max_tokens,
+        n=completions_per_request
+    )
+    completions = [choice['message']['content'] for choice in response['choices']]
+    for completion in completions:
+        if completion is not None:
+            response_cache.add(model, system_prompt, user_prompt, max_tokens, completion)
+    logging.info(f"Received {len(completions)} completions.")
+    return completions
+
+class CompletionPool:
+    """
+    Post-processed messages for each (user prompt, system prompt, model, max tokens) key, like the response cache.
+
+    Messages are drawn one at a time; when a key runs low it is refilled in the background with a single
+    multi-completion request, so most sends don't wait on the API at all.
+    """
+    def __init__(self, fetch, low_water=1, max_age=300):
+        self.fetch = fetch
+        self.low_water = low_water
+        self.max_age = max_age
+        self.pools = {}
+        self.refilling = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='refill')
+
+    def fill(self, key):
+        messages = [post_process(completion) for completion in self.fetch(*key)]
+        now = time.time()
+        with self.lock:
+            self.pools.setdefault(key, deque()).extend((now, message) for message in messages)
+
+    def pop(self, key):
+        """
+        Returns the oldest message for the key that hasn't expired, or None. Must be called with the lock held
+        """
+        pool = self.pools.get(key)
+        while pool:
+            created_at, message = pool.popleft()
+            if time.time() - created_at < self.max_age:
+                return message
+        return None
+
+    def refill(self, key):
+        try:
+            self.fill(key)
+        except LLMCancelled:
+            pass
+        except Exception as e:
+            logging.error(f"An error occurred while refilling the message pool: {str(e)}")
+        finally:
+            with self.lock:
+                self.refilling.discard(key)
+
+    def schedule_refill(self, key):
+        with self.lock:
+            if len(self.pools.get(key, ())) > self.low_water or key in self.refilling:
+                return
+            self.refilling.add(key)
+        self.executor.submit(self.refill, key)
+
+    def prepare(self, user_prompt, system_prompt, model, max_tokens):
+        """
+        Makes sure a message for the prompts and model is pooled without taking it, waiting on the API if needed
+        """
+        key = (user_prompt, system_prompt, model, max_tokens)
+        with self.lock:
+            pool = self.pools.get(key)
+            while pool and time.time() - pool[0][0] >= self.max_age:
+                pool.popleft()
+            if pool:
+                return
+        self.fill(key)
+
+    def take(self, user_prompt, system_prompt, model, max_tokens):
+        """
+        Returns a message for the prompts and model, only waiting on the API when the pool for them is empty
+        """
+        key = (user_prompt, system_prompt, model, max_tokens)
+        with self.lock:
+            message = self.pop(key)
         if message is None:
-            message = "Join the FriendchatRS FC!"
-        message = message.strip('"')
-        effect = random.choice(effects)
-        message = f"{effect} {message}"
-        message = message.encode('ascii', 'ignore').decode('ascii')
+            self.fill(key)
+            with self.lock:
+                message = self.pop(key)
+        self.schedule_refill(key)
+        return message
 
+completion_pool = CompletionPool(request_completions, pool_low_water, prepared_message_ttl)
+
+def generate_message(user_prompt, system_prompt):
+    """
+    Generates a message based on the current UTC time using GPT-3
+    """
+    logging.info(f"Current UTC time: {datetime.datetime.utcnow().isoformat()}")
+    
+    try:
+        settings = settings_watcher.get()
+        message = completion_pool.take(user_prompt, system_prompt, settings.model, settings.max_tokens)
         logging.info(f"Generated message: {message}")
         return message
+    except LLMCancelled:
+        logging.info("Message generation cancelled because the bot is stopping.")
+        return None
     except Exception as e:
         logging.error(f"An error occurred while generating the message: {str(e)}")
         return None
 
-def start_bot(bot_config):
+def prepare_message(user_prompt, system_prompt):
+    """
+    Pools a message for the prompts ahead of a send, returning whether one is ready
+    """
+    try:
+        settings = settings_watcher.get()
+        completion_pool.prepare(user_prompt, system_prompt, settings.model, settings.max_tokens)
+        return True
+    except LLMCancelled:
+        logging.info("Message preparation cancelled because the bot is stopping.")
+        return False
+    except Exception as e:
+        logging.error(f"An error occurred while preparing the message: {str(e)}")
+        return False
+
+def get_prompts(settings, current_time):
+    """
+    Returns the user prompt and system prompt scheduled for the given UTC time
+    """
+    slot = prompt_schedule.slot_at(current_time, settings)
+    return slot.user_prompt, slot.system_prompt
+
+class PreparedMessage:
+    """
+    A message pooled in the background for an upcoming send slot.
+
+    The message is only taken from the pool at send time, so it stays pooled for its prompts if they change first.
+    """
+    def __init__(self, user_prompt, system_prompt):
+        self.user_prompt = user_prompt
+        self.system_prompt = system_prompt
+        self.created_at = time.time()
+        self.future = prefetch_executor.submit(prepare_message, user_prompt, system_prompt)
+
+    def matches(self, user_prompt, system_prompt):
+        """
+        Returns whether the message was prepared for these prompts and is still fresh
+        """
+        return (self.user_prompt == user_prompt and self.system_prompt == system_prompt
+                and time.time() - self.created_at < prepared_message_ttl)
+
+def get_message(prepared, user_prompt, system_prompt):
+    """
+    Returns a message for the current prompts, taken from the pool the prepared message filled when it still fits
+    """
+    if prepared is not None:
+        if prepared.matches(user_prompt, system_prompt):
+            if prepared.future.result():  # Usually finished during the sleep window
+                logging.info("Using the message prepared during the sleep window.")
+        else:
+            prepared.future.cancel()
+            logging.info("Prepared message no longer matches the current prompts, leaving it pooled and regenerating.")
+    return generate_message(user_prompt, system_prompt)
+
+def start_bot():
     stop_event.clear()
     try:
         windows = get_runescape_windows()
@@ -140,45 +422,55 @@ def start_bot(bot_config):
         logging.error(f"An error occurred while getting the RuneScape windows: {str(e)}")
         sys.exit(1)
 
+    consecutive_errors = 0
     while not stop_event.is_set():
         try:
-            sleep_time = random.uniform(min_sleep_time, max_sleep_time)
+            settings = settings_watcher.get()
+            sleep_time = random.uniform(settings.min_sleep_time, settings.max_sleep_time)
             logging.info(f"Sleeping for {sleep_time/60:.2f} minutes")
 
+            # Generate the message for the slot at the end of the sleep window while sleeping,
+            # unless messages are streamed as they are typed
+            prepared = None
+            if not settings.stream_messages:
+                send_time = datetime.datetime.utcnow() + datetime.timedelta(seconds=sleep_time)
+                prepared = PreparedMessage(*get_prompts(settings, send_time))
+
             start_time = time.time()
             while time.time() - start_time < sleep_time:
                 if stop_event.is_set():
                     return
                 time.sleep(1)
 
-            if windows:
-                window = windows.popleft()  # Get the next window
-                windows.append(window)  # Add the window back to the end of the queue
+            settings = settings_watcher.get()
+            slot = prompt_schedule.update()
+            user_prompt, system_prompt = slot.user_prompt, slot.system_prompt
+            if settings.stream_messages:
+                message = stream_message(user_prompt, system_prompt)
+            else:
+                message = get_message(prepared, user_prompt, system_prompt)
 
-                window.activate()
-                press_hotkey()
+            if stop_event.is_set():
+                return
 
-                if stop_event.is_set():
-                    return
+            if message is not None:
+                if windows:
+                    window = windows.popleft()  # Get the next window
+                    windows.append(window)  # Add the window back to the end of the queue
 
-            current_time = datetime.datetime.utcnow()
-            time_interval = int(bot_config['Settings']['time_interval'])
-            user_prompts = list(bot_config['user_prompts'].values())
-            prompt_index = (current_time.minute // time_interval) % len(user_prompts)
-            user_prompt = user_prompts[prompt_index]
-
-            current_hour = datetime.datetime.utcnow().hour
-            if 6 <= current_hour < 12:
-                system_prompt = bot_config['system_prompts']['morning_prompt']
-            elif 12 <= current_hour < 18:
-                system_prompt = bot_config['system_prompts']['afternoon_prompt']
-            else:
-                system_prompt = bot_config['system_prompts']['night_prompt']
+                    call_with_retry(window.activate, attempts=3, base_delay=0.5, max_delay=2, stop_event=stop_event,
+                                    is_retryable=lambda e: True, description='window activation')
+                    press_hotkey()
 
-            message = generate_message(user_prompt, system_prompt)
-            if message is not None:
-                logging.info(f"Typing message: {message}")
-                type_message(message)
+                    if stop_event.is_set():
+                        return
+
+                if settings.stream_messages:
+                    logging.info("Typing message as it streams in.")
+                    logging.info(f"Typed message: {type_message(message)}")
+                else:
+                    logging.info(f"Typing message: {message}")
+                    type_message(message)
 
             if stop_event.is_set():
                 return
@@ -189,12 +481,16 @@ def start_bot(bot_config):
                     return
                 time.sleep(1)
 
+            consecutive_errors = 0
         except KeyboardInterrupt:
             logging.info("Program terminated by user")
             break
         except Exception as e:
-            logging.error(f"An unexpected error occurred: {str(e)}")
-            time.sleep(60)  # Wait a bit before the next iteration to prevent rapid-fire error messages
+            # Back off exponentially on repeated errors to prevent rapid-fire error messages
+            delay = backoff_delay(consecutive_errors, 5, 60)
+            consecutive_errors += 1
+            logging.error(f"An unexpected error occurred: {str(e)}. Retrying in {delay:.0f} seconds.")
+            stop_event.wait(delay)
 
 def stop_bot():
     stop_event.set()
\ No newline at end of file
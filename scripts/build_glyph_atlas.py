@@ -0,0 +1,70 @@
+"""
+Builds the glyph atlas used by the glyph OCR engine from a directory of labelled glyph images.
+
+Each image holds a single glyph cropped from a chat screenshot at the font's full line height, with the
+glyph at its natural vertical position. The file name is the glyph's Unicode code point in hex, for example
+0041.png for 'A' or 003a.png for ':'. All images must share the same height and baseline row.
+
+Example:
+    python build_glyph_atlas.py glyphs/ glyph_atlas.npz --baseline 11 --space-width 3
+"""
+import argparse
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from chat_ocr import binarize_text
+
+
+def build_glyph_atlas(glyph_dir, baseline):
+    """
+    Returns the characters, padded glyph masks, widths and baseline offsets of every glyph image in glyph_dir
+    """
+    chars = []
+    crops = []
+    offsets = []
+    for path in sorted(glob.glob(os.path.join(glyph_dir, '*.png'))):
+        code_point = os.path.splitext(os.path.basename(path))[0]
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            print(f"Skipping unreadable image: {path}")
+            continue
+        binary = binarize_text(image).astype(bool)
+        rows, columns = np.nonzero(binary)
+        if len(rows) == 0:
+            print(f"Skipping empty glyph: {path}")
+            continue
+        chars.append(chr(int(code_point, 16)))
+        crops.append(binary[rows.min():rows.max() + 1, columns.min():columns.max() + 1])
+        offsets.append(rows.max() - baseline)
+
+    if not crops:
+        raise ValueError(f"No glyph images found in {glyph_dir}")
+
+    cell_height = max(crop.shape[0] for crop in crops)
+    cell_width = max(crop.shape[1] for crop in crops)
+    glyphs = np.zeros((len(crops), cell_height, cell_width), dtype=bool)
+    for index, crop in enumerate(crops):
+        glyphs[index, :crop.shape[0], :crop.shape[1]] = crop
+    widths = np.array([crop.shape[1] for crop in crops], dtype=np.int32)
+    return np.array(chars), glyphs, widths, np.array(offsets, dtype=np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a glyph atlas for the glyph OCR engine.')
+    parser.add_argument('glyph_dir', help='Directory of glyph images named by hex code point')
+    parser.add_argument('output', help='Path of the .npz atlas to write')
+    parser.add_argument('--baseline', type=int, required=True, help='Row of the baseline in the glyph images')
+    parser.add_argument('--space-width', type=int, default=3, help='Minimum gap in pixels that counts as a space')
+    args = parser.parse_args()
+
+    chars, glyphs, widths, offsets = build_glyph_atlas(args.glyph_dir, args.baseline)
+    np.savez_compressed(args.output, chars=chars, glyphs=glyphs, widths=widths, offsets=offsets,
+                        space_width=args.space_width)
+    print(f"Wrote {len(chars)} glyphs to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import difflib
+import hashlib
+import logging
+import math
+import random
+import re
+import zlib
+from collections import OrderedDict, deque
+
+import numpy as np
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Characters that OCR commonly confuses, mapped to a single canonical form before hashing
+OCR_CONFUSIONS = str.maketrans({'0': 'o', '1': 'l', 'i': 'l', '|': 'l', '5': 's', '8': 'b'})
+
+
+def normalize_line(name, message):
+    """
+    Returns a canonical form of a chat line that ignores case, punctuation, spacing and common OCR confusions
+    """
+    text = f"{name}:{message}".lower().translate(OCR_CONFUSIONS)
+    return re.sub(r'[^a-z0-9:]+', '', text)
+
+
+class ChatLineTracker:
+    """
+    Remembers chat lines that have already been seen and reports only newly appeared ones.
+
+    Lines are keyed by a hash of their normalised (name, text); lines that are not an exact match
+    are still treated as seen when they are at least `similarity_threshold` similar to a recent line.
+    """
+
+    def __init__(self, window_size=200, similarity_threshold=0.9, history=None):
+        self.window_size = window_size
+        self.similarity_threshold = similarity_threshold
+        self.seen = OrderedDict()  # hash -> normalised line, oldest first
+        self.history = history if history is not None else deque(maxlen=window_size)
+
+    def is_seen(self, key, normalized):
+        if key in self.seen:
+            self.seen.move_to_end(key)
+            return True
+        matcher = difflib.SequenceMatcher(None, b=normalized)
+        for seen_line in reversed(self.seen.values()):
+            matcher.set_seq1(seen_line)
+            if (matcher.real_quick_ratio() >= self.similarity_threshold
+                    and matcher.quick_ratio() >= self.similarity_threshold
+                    and matcher.ratio() >= self.similarity_threshold):
+                return True
+        return False
+
+    def remember(self, key, normalized):
+        self.seen[key] = normalized
+        while len(self.seen) > self.window_size:
+            self.seen.popitem(last=False)
+
+    def update(self, player_messages):
+        """
+        Takes the (name, message) pairs visible in the current frame and returns a (name, message, context)
+        triple for each line not seen before, where context is the history as it was just before that line
+        """
+        new_messages = []
+        for name, message in player_messages:
+            normalized = normalize_line(name, message)
+            if not normalized:
+                continue
+            key = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest()
+            seen = self.is_seen(key, normalized)
+            self.remember(key, normalized)  # Jittered variants are remembered too, so they hit the hash next time
+            if seen:
+                continue
+            new_messages.append((name, message, list(self.history)))
+            self.history.append((name, message))
+        return new_messages
+
+
+def is_ocr_garbage(message, min_word_ratio=0.5):
+    """
+    Returns whether a chat message looks like OCR noise: mostly symbols, or made of fragments rather than words
+    """
+    text = message.strip()
+    if not text:
+        return True
+    readable = sum(char.isalnum() or char.isspace() for char in text)
+    if readable / len(text) < 0.7:
+        return True
+    tokens = text.split()
+    words = [token for token in tokens if re.fullmatch(r"[A-Za-z][A-Za-z']+[.,!?]*", token)]
+    return len(words) / len(tokens) < min_word_ratio
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens with tiktoken when it is installed, or estimates about four characters per token
+    """
+
+    def __init__(self, encoding_name='cl100k_base'):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"Could not load the {encoding_name} tokenizer, estimating token counts: {str(e)}")
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return math.ceil(len(text) / 4)
+
+
+class ContextBuilder:
+    """
+    Builds the user prompt for a reply from recent chat lines, within a token budget.
+
+    The budget covers the system prompt, the line being answered and the context lines before it. The newest
+    context lines are kept first; repeated lines and OCR garbage are dropped, and so is anything that doesn't fit.
+    """
+
+    def __init__(self, token_budget=250, counter=None):
+        self.token_budget = token_budget
+        self.counter = counter if counter is not None else TokenCounter()
+
+    def build(self, history, name, message, system_prompt=''):
+        """
+        Takes the recent (name, message) pairs, oldest first, and returns the prompt answering name's message
+        """
+        current = f"{name}: {message}"
+        remaining = self.token_budget - self.counter.count(system_prompt) - self.counter.count(current)
+        seen = {normalize_line(name, message)}
+        context = []
+        for line_name, line_message in reversed(history):
+            normalized = normalize_line(line_name, line_message)
+            if normalized in seen or is_ocr_garbage(line_message):
+                continue
+            seen.add(normalized)
+            line = f"{line_name}: {line_message}"
+            tokens = self.counter.count(line) + 1  # The newline joining it to the prompt
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            context.append(line)
+        context.reverse()
+        context.append(current)
+        return '\n'.join(context)
+
+
+class ReplyIndex:
+    """
+    Replies to recently answered chat messages, looked up by how similar a new message is to the answered ones.
+
+    Messages are embedded as hashed character n-gram counts, weighted by inverse document frequency and compared
+    by cosine similarity. Up to capacity replies are kept and the least recently used is evicted; each reply is
+    reused at most max_reuse times so the bot doesn't keep repeating itself.
+    """
+
+    def __init__(self, capacity=256, threshold=0.85, ngram_size=3, dimensions=4096, max_reuse=3):
+        self.threshold = threshold
+        self.ngram_size = ngram_size
+        self.dimensions = dimensions
+        self.max_reuse = max_reuse
+        self.counts = np.zeros((capacity, dimensions), dtype=np.float32)  # One row of n-gram counts per message
+        self.document_frequency = np.zeros(dimensions, dtype=np.float32)  # Stored messages containing each n-gram
+        self.occupied = np.zeros(capacity, dtype=bool)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.uses = np.zeros(capacity, dtype=np.int32)
+        self.replies = [None] * capacity
+        self.clock = 0
+
+    def vectorize(self, message):
+        """
+        Returns the hashed character n-gram counts of a message, normalised so punctuation, spacing and OCR
+        confusions don't count as differences
+        """
+        # Like normalize_line, ignore case, punctuation and common OCR confusions, but keep word boundaries
+        text = re.sub(r'[^a-z0-9]+', ' ', message.lower().translate(OCR_CONFUSIONS)).strip()
+        text = f" {text} "
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for start in range(max(1, len(text) - self.ngram_size + 1)):
+            gram = text[start:start + self.ngram_size]
+            vector[zlib.crc32(gram.encode('utf-8')) % self.dimensions] += 1
+        return vector
+
+    def remove(self, slot):
+        self.document_frequency -= self.counts[slot] > 0
+        self.counts[slot] = 0
+        self.occupied[slot] = False
+        self.replies[slot] = None
+
+    def lookup(self, message):
+        """
+        Returns the reply to the most similar answered message if it is similar enough, or None
+        """
+        if not self.occupied.any():
+            return None
+        slots = np.flatnonzero(self.occupied)
+        idf = np.log((1 + len(slots)) / (1 + self.document_frequency)) + 1
+        query = self.vectorize(message) * idf
+        stored = self.counts[slots] * idf
+        norms = np.linalg.norm(stored, axis=1) * np.linalg.norm(query)
+        similarities = stored @ query / np.maximum(norms, 1e-9)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        slot = slots[best]
+        reply = self.replies[slot]
+        logger.debug(f"Reusing a reply, similarity {similarities[best]:.2f}")
+        self.uses[slot] += 1
+        if self.uses[slot] >= self.max_reuse:
+            self.remove(slot)
+        else:
+            self.clock += 1
+            self.last_used[slot] = self.clock
+        return reply
+
+    def add(self, message, reply):
+        """
+        Stores the reply to a message, evicting the least recently used reply when the index is full
+        """
+        free = np.flatnonzero(~self.occupied)
+        if len(free):
+            slot = free[0]
+        else:
+            slot = int(np.argmin(self.last_used))
+            self.remove(slot)
+        vector = self.vectorize(message)
+        self.counts[slot] = vector
+        self.document_frequency += vector > 0
+        self.occupied[slot] = True
+        self.uses[slot] = 0
+        self.clock += 1
+        self.last_used[slot] = self.clock
+        self.replies[slot] = reply
+
+
+def vary_reply(reply):
+    """
+    Returns a reused reply with small changes to its capitalisation and closing punctuation
+    """
+    text = reply.rstrip('.!? ')
+    if text and random.random() < 0.5:
+        text = text[0].swapcase() + text[1:]
+    return text + random.choice(['', '.', '!', '!!', ' lol'])
@@ -0,0 +1,453 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+# Text colours (BGR) of each chat channel, for isolate_chat_channels
+CHAT_CHANNEL_COLOURS = {
+    'public': [(0, 0, 0), (255, 0, 0)],  # Black names, blue messages
+    'clan': [(0, 0, 127), (127, 0, 0)],  # Dark red clan name, dark blue names and messages
+    'friends': [(0, 0, 127), (0, 0, 0)],  # Dark red messages, black names
+}
+
+
+class PytesseractEngine:
+    """
+    OCR engine that runs the tesseract binary through pytesseract for every image
+    """
+
+    name = 'pytesseract'
+
+    def recognize(self, image, single_line=False):
+        config = '--psm 7' if single_line else ''
+        return pytesseract.image_to_string(image, config=config)
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """
+    OCR engine that keeps a single Tesseract API instance loaded for the life of the bot.
+
+    Images are handed over as raw NumPy buffers, so there are no temp files or subprocesses.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, tessdata_path=None, lang='eng'):
+        if tesserocr is None:
+            raise ImportError("tesserocr is not installed")
+        if tessdata_path:
+            self.api = tesserocr.PyTessBaseAPI(path=tessdata_path, lang=lang)
+        else:
+            self.api = tesserocr.PyTessBaseAPI(lang=lang)
+        self.lock = threading.Lock()  # The Tesseract API is not safe to share between threads
+
+    def recognize(self, image, single_line=False):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+        page_seg_mode = tesserocr.PSM.SINGLE_LINE if single_line else tesserocr.PSM.AUTO
+        with self.lock:
+            self.api.SetPageSegMode(page_seg_mode)
+            self.api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, image.strides[0])
+            return self.api.GetUTF8Text()
+
+    def close(self):
+        with self.lock:
+            self.api.End()
+
+
+def create_ocr_engine(name='auto', tessdata_path=None, lang='eng', atlas_path=None, scale=1):
+    """
+    Creates the requested OCR engine ('auto', 'tesserocr', 'pytesseract' or 'glyph').
+
+    'auto' prefers the persistent tesserocr engine and falls back to pytesseract. 'glyph' matches the game's
+    bitmap font against the glyph atlas at atlas_path and uses the 'auto' engine for lines it can't read.
+    """
+    if name == 'glyph':
+        if not atlas_path:
+            raise ValueError("The glyph OCR engine needs a glyph atlas path")
+        fallback = create_ocr_engine('auto', tessdata_path, lang)
+        return GlyphAtlasEngine(load_glyph_atlas(atlas_path), fallback, scale)
+    if name in ('auto', 'tesserocr'):
+        try:
+            return TesserocrEngine(tessdata_path, lang)
+        except Exception as e:
+            if name == 'tesserocr':
+                raise
+            logger.warning(f"Falling back to pytesseract, tesserocr is unavailable: {str(e)}")
+    if name in ('auto', 'pytesseract'):
+        return PytesseractEngine()
+    raise ValueError(f"Unknown OCR engine: {name}")
+
+
+class LineTextCache:
+    """
+    Bounded LRU cache of chat line strip hash -> recognized text
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        text = self.entries.get(key)
+        if text is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def put(self, key, text):
+        self.entries[key] = text
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+def strip_key(strip):
+    """
+    Returns a hash of a line strip's pixels and shape
+    """
+    digest = hashlib.blake2b(np.ascontiguousarray(strip).tobytes(), digest_size=16)
+    digest.update(str(strip.shape).encode('ascii'))
+    return digest.digest()
+
+
+def isolate_chat_channels(image, colours, tolerance=40, scale=1):
+    """
+    Keeps only pixels matching one of the given BGR text colours and returns dark text on a white background.
+
+    Glyphs are optionally upscaled by an integer factor with nearest-neighbour sampling, which keeps the
+    bitmap font's edges sharp for OCR.
+    """
+    mask = np.zeros(image.shape[:2], dtype=np.uint8)
+    for colour in colours:
+        lower = np.clip(np.array(colour, dtype=np.int16) - tolerance, 0, 255).astype(np.uint8)
+        upper = np.clip(np.array(colour, dtype=np.int16) + tolerance, 0, 255).astype(np.uint8)
+        mask |= cv2.inRange(image, lower, upper)
+    isolated = cv2.bitwise_not(mask)
+    if scale > 1:
+        isolated = cv2.resize(isolated, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+    return isolated
+
+
+def binarize_text(grayscale):
+    """
+    Returns a 0/1 image where 1 marks text pixels.
+
+    The text colour is taken to be whichever Otsu class covers fewer pixels, so this works for both
+    dark text on a light panel and light text on a dark panel.
+    """
+    _, binary = cv2.threshold(grayscale, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if binary.mean() > 0.5:
+        binary = 1 - binary
+    return binary
+
+
+def find_runs(flags):
+    """
+    Returns the start and end (exclusive) indices of each run of True values in a 1-D array
+    """
+    edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def segment_lines(grayscale, min_height=4, padding=2):
+    """
+    Splits a grayscale chat image into horizontal line strips using a horizontal projection profile
+    """
+    binary = binarize_text(grayscale)
+    # Ignore columns that are filled almost top to bottom, such as the panel border or scrollbar
+    binary[:, binary.mean(axis=0) > 0.9] = 0
+    starts, ends = find_runs(binary.sum(axis=1) > 0)
+
+    height = grayscale.shape[0]
+    strips = []
+    for start, end in zip(starts, ends):
+        if end - start < min_height:
+            continue
+        strips.append(grayscale[max(0, start - padding):min(height, end + padding)])
+    return strips
+
+
+def load_glyph_atlas(atlas_path):
+    """
+    Loads a glyph atlas written by build_glyph_atlas.py
+    """
+    with np.load(atlas_path) as atlas:
+        return {
+            'chars': [str(char) for char in atlas['chars']],
+            'glyphs': atlas['glyphs'].astype(bool),
+            'widths': atlas['widths'].astype(np.int32),
+            'offsets': atlas['offsets'].astype(np.int32),
+            'space_width': int(atlas['space_width']),
+        }
+
+
+class GlyphAtlasEngine:
+    """
+    OCR engine for the game's bitmap chat font that matches segmented glyphs against a prebuilt glyph atlas.
+
+    Each glyph is cropped to its bounding box, placed in the atlas cell size and compared against every atlas
+    glyph at once; vertical position relative to the baseline separates glyphs like ',' and "'". Lines with a
+    glyph that doesn't match well enough are handed to the fallback engine.
+    """
+
+    name = 'glyph'
+
+    def __init__(self, atlas, fallback=None, scale=1, max_mismatch=0.2):
+        glyphs = atlas['glyphs']
+        if scale > 1:
+            glyphs = np.repeat(np.repeat(glyphs, scale, axis=1), scale, axis=2)
+        self.chars = atlas['chars']
+        self.glyphs = glyphs
+        self.glyph_pixels = glyphs.sum(axis=(1, 2))
+        self.widths = atlas['widths'] * scale
+        self.offsets = atlas['offsets'] * scale
+        self.space_width = atlas['space_width'] * scale
+        self.offset_tolerance = scale  # Allow the baseline estimate to be off by one font pixel
+        self.candidate_widths = sorted(set(self.widths.tolist()), reverse=True)
+        self.fallback = fallback
+        self.max_mismatch = max_mismatch
+
+    def match_glyph(self, glyph, baseline, width=None):
+        """
+        Returns the character best matching a binary glyph crop and its mismatch ratio, or (None, None) if nothing
+        matches well enough. With a width, only characters exactly that wide in the atlas are considered
+        """
+        rows, columns = np.nonzero(glyph)
+        if len(rows) == 0:
+            return None, None
+        glyph = glyph[rows.min():rows.max() + 1, columns.min():columns.max() + 1]
+        cell_height, cell_width = self.glyphs.shape[1:]
+        if glyph.shape[0] > cell_height or glyph.shape[1] > cell_width:
+            return None, None
+        cell = np.zeros((cell_height, cell_width), dtype=bool)
+        cell[:glyph.shape[0], :glyph.shape[1]] = glyph
+
+        mismatches = np.count_nonzero(self.glyphs != cell, axis=(1, 2))
+        mismatch_ratio = mismatches / (self.glyph_pixels + glyph.sum())
+        # Glyphs sitting at a different height relative to the baseline can't be the same character
+        mismatch_ratio[np.abs(self.offsets - (rows.max() - baseline)) > self.offset_tolerance] = np.inf
+        if width is not None:
+            mismatch_ratio[self.widths != width] = np.inf
+        best = int(np.argmin(mismatch_ratio))
+        if mismatch_ratio[best] > self.max_mismatch:
+            return None, None
+        return self.chars[best], mismatch_ratio[best]
+
+    def match_segment(self, segment, baseline):
+        """
+        Returns the characters in a run of touching glyph columns, splitting it when glyphs are joined.
+
+        A piece is only read as a character exactly as wide as it, so a piece holding one glyph plus part of the
+        next can't pass for the first glyph. Of the splits where every piece matches, the one with the lowest total
+        mismatch wins; a run that can't be split returns None so the line goes to the fallback engine
+        """
+        width = segment.shape[1]
+        char, _ = self.match_glyph(segment, baseline, width)
+        if char is not None:
+            return char
+
+        # best[position] is the (total mismatch, text) of the best split of the columns before position
+        best = [None] * (width + 1)
+        best[0] = (0.0, '')
+        for position in range(width):
+            if best[position] is None:
+                continue
+            for candidate_width in self.candidate_widths:
+                end = position + candidate_width
+                if end > width:
+                    continue
+                char, mismatch = self.match_glyph(segment[:, position:end], baseline, candidate_width)
+                if char is None:
+                    continue
+                total = best[position][0] + mismatch
+                if best[end] is None or total < best[end][0]:
+                    best[end] = (total, best[position][1] + char)
+        return best[width][1] if best[width] is not None else None
+
+    def recognize_line(self, grayscale):
+        binary = binarize_text(grayscale).astype(bool)
+        row_starts, row_ends = find_runs(binary.any(axis=1))
+        if len(row_starts) == 0:
+            return ''
+        binary = binary[row_starts[0]:row_ends[-1]]
+        column_starts, column_ends = find_runs(binary.any(axis=0))
+
+        # The baseline is the row most glyphs end on
+        bottoms = [np.flatnonzero(binary[:, start:end].any(axis=1))[-1]
+                   for start, end in zip(column_starts, column_ends)]
+        baseline = int(np.bincount(bottoms).argmax())
+
+        text = ''
+        previous_end = None
+        for start, end in zip(column_starts, column_ends):
+            if previous_end is not None and start - previous_end >= self.space_width:
+                text += ' '
+            chars = self.match_segment(binary[:, start:end], baseline)
+            if chars is None:
+                return None
+            text += chars
+            previous_end = end
+        return text
+
+    def recognize(self, image, single_line=False):
+        strips = [image] if single_line else segment_lines(image)
+        lines = []
+        for strip in strips:
+            text = self.recognize_line(strip)
+            if text is None:
+                if self.fallback is None:
+                    text = ''
+                else:
+                    text = self.fallback.recognize(strip, single_line=True).strip()
+            lines.append(text)
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
+
+
+class OCREnginePool:
+    """
+    Recognizes line strips in parallel, with one OCR engine per worker thread.
+
+    Tesseract releases the GIL while recognizing, so worker threads run on separate cores.
+    """
+
+    def __init__(self, engine_factory, workers):
+        self.engine_factory = engine_factory
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr')
+        self.local = threading.local()
+        self.engines = []
+        self.lock = threading.Lock()
+
+    def get_engine(self):
+        engine = getattr(self.local, 'engine', None)
+        if engine is None:
+            engine = self.engine_factory()
+            self.local.engine = engine
+            with self.lock:
+                self.engines.append(engine)
+        return engine
+
+    def recognize_line(self, strip):
+        return self.get_engine().recognize(strip, single_line=True)
+
+    def recognize_many(self, strips):
+        """
+        Returns the text of each strip, in the same order as the strips
+        """
+        return list(self.executor.map(self.recognize_line, strips))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            for engine in self.engines:
+                engine.close()
+            self.engines.clear()
+
+
+def recognize_lines(engine, strips, cache, pool=None):
+    """
+    Returns the text of each line strip, only sending strips missing from the cache to OCR.
+
+    Cache misses are spread across the pool when one is given and there is more than one miss.
+    """
+    keys = [strip_key(strip) for strip in strips]
+    lines = [cache.get(key) for key in keys]
+    missing = [index for index, text in enumerate(lines) if text is None]
+
+    if pool is not None and len(missing) > 1:
+        texts = pool.recognize_many([strips[index] for index in missing])
+    else:
+        texts = [engine.recognize(strips[index], single_line=True) for index in missing]
+
+    for index, text in zip(missing, texts):
+        lines[index] = text.strip()
+        cache.put(keys[index], lines[index])
+    return lines
+
+
+def frame_signature(image, size=(64, 64)):
+    """
+    Returns a downscaled grayscale signature of a captured frame
+    """
+    thumbnail = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    if thumbnail.ndim == 3:
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+    return thumbnail.astype(np.int16)
+
+
+def frame_changed(signature, previous_signature, threshold=4.0):
+    """
+    Returns whether a frame differs enough from the previous signature to be worth OCR
+    """
+    if previous_signature is None or signature.shape != previous_signature.shape:
+        return True
+    row_differences = np.abs(signature - previous_signature).mean(axis=1)
+    return bool(row_differences.max() > threshold)
+
+
+def extract_text(image, engine, cache=None, pool=None, colours=None, tolerance=40, scale=1):
+    """
+    Returns the text of the chat box in a captured frame.
+
+    With colours, only pixels in those text colours are read, upscaled by scale; otherwise the whole chat box is
+    read in grayscale. Line strips already in the cache aren't recognized again.
+    """
+    try:
+        # Keep only the selected chat channels' text, or read the whole chat box in grayscale
+        if colours:
+            grayscale = isolate_chat_channels(image, colours, tolerance, scale)
+        elif image.ndim == 3:
+            grayscale = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            grayscale = image
+
+        # Split the chat into line strips and only OCR the ones that aren't cached
+        strips = segment_lines(grayscale)
+        lines = recognize_lines(engine, strips, cache if cache is not None else LineTextCache(0), pool)
+        text = '\n'.join(line for line in lines if line)
+        return text
+    except Exception as e:
+        logger.error(f"An error occurred while extracting text from image: {str(e)}")
+        return ''
+
+
+def process_player_messages(text: str) -> List[Tuple[str, str]]:
+    """
+    Returns the (name, message) pairs of the player chat lines in extracted text
+    """
+    lines = text.split('\n')
+    player_messages = []
+    pattern = re.compile(r'^(\w+):\s*(.*)$')  # Assumes username contains only word characters
+    for line in lines:
+        match = pattern.match(line)
+        if match:
+            name = match.group(1)
+            message = match.group(2)
+            player_messages.append((name, message))
+    return player_messages
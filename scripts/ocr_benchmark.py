@@ -0,0 +1,219 @@
+"""
+Replays recorded chat screenshots through the vision_bot capture-to-parse path and reports speed and accuracy.
+
+The corpus is a directory of chat screenshots (.png, .jpg or .bmp). A screenshot may have a ground-truth
+transcript next to it with the same name and a .txt extension, holding one chat line per line.
+Frames are replayed in file name order, so a recording of consecutive frames exercises the frame-change
+gating and line cache the same way a live session does.
+
+Example:
+    python ocr_benchmark.py recordings/crowded_world --engine tesserocr --workers 4 --repeat 3
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from chat_ocr import (CHAT_CHANNEL_COLOURS, LineTextCache, OCREnginePool, create_ocr_engine, extract_text,
+                      frame_changed, frame_signature, process_player_messages)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def load_corpus(corpus_dir, colour=False):
+    """
+    Returns a list of (name, image, transcript or None) for every screenshot in the corpus.
+
+    Images are loaded in grayscale, or BGR when colour is set.
+    """
+    frames = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, '*'))):
+        base, extension = os.path.splitext(path)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        image = cv2.imread(path, cv2.IMREAD_COLOR if colour else cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            print(f"Skipping unreadable image: {path}")
+            continue
+        transcript = None
+        if os.path.exists(base + '.txt'):
+            with open(base + '.txt', 'r', encoding='utf-8') as transcript_file:
+                transcript = transcript_file.read()
+        frames.append((os.path.basename(path), image, transcript))
+    return frames
+
+
+def edit_distance(source, target):
+    """
+    Returns the Levenshtein distance between two strings
+    """
+    if len(source) < len(target):
+        source, target = target, source
+    previous = np.arange(len(target) + 1)
+    target_chars = np.array([ord(char) for char in target])
+    for index, char in enumerate(source, start=1):
+        substitutions = previous[:-1] + (target_chars != ord(char))
+        current = np.empty_like(previous)
+        current[0] = index
+        current[1:] = np.minimum(previous[1:] + 1, substitutions)
+        # Insertions depend on the value just to the left, which a running minimum resolves in one pass
+        current = np.minimum.accumulate(current - np.arange(len(current))) + np.arange(len(current))
+        previous = current
+    return int(previous[-1])
+
+
+def normalize_transcript(text):
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def run_benchmark(frames, engine, pool, cache_size, gate_frames, colours, tolerance=40, scale=1):
+    """
+    Replays the frames once and returns per-frame timings and accuracy totals
+    """
+    cache = LineTextCache(cache_size) if cache_size > 0 else None
+    previous_signature = None
+    timings = []
+    parsed_lines = 0
+    skipped_frames = 0
+    errors = 0
+    reference_chars = 0
+
+    for name, image, transcript in frames:
+        start_time = time.perf_counter()
+        signature = frame_signature(image)
+        if gate_frames and not frame_changed(signature, previous_signature):
+            skipped_frames += 1
+            timings.append(time.perf_counter() - start_time)
+            continue
+        previous_signature = signature
+
+        frame_cache = cache if cache is not None else LineTextCache(0)
+        text = extract_text(image, engine, frame_cache, pool, colours, tolerance, scale)
+        player_messages = process_player_messages(text)
+        timings.append(time.perf_counter() - start_time)
+        parsed_lines += len(player_messages)
+
+        if transcript is not None:
+            reference = normalize_transcript(transcript)
+            errors += edit_distance(normalize_transcript(text), reference)
+            reference_chars += len(reference)
+
+    return {
+        'timings': timings,
+        'parsed_lines': parsed_lines,
+        'skipped_frames': skipped_frames,
+        'errors': errors,
+        'reference_chars': reference_chars,
+        'cache_hits': cache.hits if cache is not None else 0,
+        'cache_misses': cache.misses if cache is not None else 0,
+    }
+
+
+def summarize(results, settings):
+    """
+    Combines the results of every repeat into one report
+    """
+    timings = np.array([timing for result in results for timing in result['timings']]) * 1000
+    total_seconds = timings.sum() / 1000
+    parsed_lines = sum(result['parsed_lines'] for result in results)
+    errors = sum(result['errors'] for result in results)
+    reference_chars = sum(result['reference_chars'] for result in results)
+    cache_hits = sum(result['cache_hits'] for result in results)
+    cache_lookups = cache_hits + sum(result['cache_misses'] for result in results)
+
+    return {
+        'settings': settings,
+        'frames': len(timings),
+        'skipped_frames': sum(result['skipped_frames'] for result in results),
+        'ms_per_frame': {
+            'mean': float(timings.mean()) if len(timings) else 0.0,
+            'p50': float(np.percentile(timings, 50)) if len(timings) else 0.0,
+            'p90': float(np.percentile(timings, 90)) if len(timings) else 0.0,
+            'p99': float(np.percentile(timings, 99)) if len(timings) else 0.0,
+        },
+        'lines_per_second': parsed_lines / total_seconds if total_seconds else 0.0,
+        'character_error_rate': errors / reference_chars if reference_chars else None,
+        'cache_hit_rate': cache_hits / cache_lookups if cache_lookups else None,
+    }
+
+
+def print_report(report):
+    print(f"Settings:         {report['settings']}")
+    print(f"Frames:           {report['frames']} ({report['skipped_frames']} skipped as unchanged)")
+    timing = report['ms_per_frame']
+    print(f"ms/frame:         mean {timing['mean']:.2f}  p50 {timing['p50']:.2f}  "
+          f"p90 {timing['p90']:.2f}  p99 {timing['p99']:.2f}")
+    print(f"Lines/s:          {report['lines_per_second']:.1f}")
+    if report['character_error_rate'] is not None:
+        print(f"Char error rate:  {report['character_error_rate']:.2%}")
+    else:
+        print("Char error rate:  n/a (no transcripts)")
+    if report['cache_hit_rate'] is not None:
+        print(f"Cache hit rate:   {report['cache_hit_rate']:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vision_bot OCR pipeline on recorded screenshots.')
+    parser.add_argument('corpus', help='Directory of chat screenshots with optional .txt transcripts')
+    parser.add_argument('--engine', default='auto', help="OCR engine: 'auto', 'tesserocr', 'pytesseract' or 'glyph'")
+    parser.add_argument('--atlas', default='glyph_atlas.npz', help='Glyph atlas used by the glyph engine')
+    parser.add_argument('--tessdata', help='Tesseract tessdata directory used by the tesserocr engine')
+    parser.add_argument('--workers', type=int, default=1, help='OCR worker threads (1 keeps OCR serial)')
+    parser.add_argument('--cache-size', type=int, default=512, help='Line cache size (0 disables the cache)')
+    parser.add_argument('--no-gating', action='store_true', help='OCR every frame, even unchanged ones')
+    parser.add_argument('--channels', default='',
+                        help=f"Comma-separated chat channels to isolate by colour ({', '.join(CHAT_CHANNEL_COLOURS)})")
+    parser.add_argument('--colour-tolerance', type=int, default=40,
+                        help='Maximum difference per colour component for a pixel to count as text')
+    parser.add_argument('--upscale', type=int, default=2, help='Integer factor applied to isolated glyphs before OCR')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of times to replay the corpus')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    channels = [channel for channel in args.channels.split(',') if channel]
+    unknown_channels = [channel for channel in channels if channel not in CHAT_CHANNEL_COLOURS]
+    if unknown_channels:
+        parser.error(f"Unknown chat channels: {', '.join(unknown_channels)}")
+    colours = [colour for channel in channels for colour in CHAT_CHANNEL_COLOURS[channel]]
+
+    frames = load_corpus(args.corpus, colour=bool(colours))
+    if not frames:
+        parser.error(f"No screenshots found in {args.corpus}")
+
+    scale = args.upscale if colours else 1
+    engine = create_ocr_engine(args.engine, args.tessdata, atlas_path=args.atlas, scale=scale)
+    pool = None
+    if args.workers > 1:
+        pool = OCREnginePool(lambda: create_ocr_engine(args.engine, args.tessdata, atlas_path=args.atlas, scale=scale),
+                             args.workers)
+
+    settings = {
+        'engine': engine.name,
+        'workers': args.workers,
+        'cache_size': args.cache_size,
+        'gating': not args.no_gating,
+        'channels': channels,
+        'repeat': args.repeat,
+    }
+    try:
+        results = [run_benchmark(frames, engine, pool, args.cache_size, not args.no_gating, colours,
+                                 args.colour_tolerance, scale)
+                   for _ in range(args.repeat)]
+    finally:
+        engine.close()
+        if pool is not None:
+            pool.close()
+
+    report = summarize(results, settings)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
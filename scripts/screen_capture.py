@@ -0,0 +1,241 @@
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pyautogui
+import pygetwindow as gw
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+logger = logging.getLogger(__name__)
+
+# Width/height ratio of the chat lines area that sits directly above the chat tab strip; both scale with the
+# interface, so the area's height is estimated from the width of the matched strip
+CHAT_LINES_ASPECT_RATIO = 3.7
+
+# Minimum fraction of the strip's width a horizontal edge must cover to be taken for the chat panel's top border
+CHAT_BORDER_MIN_COVERAGE = 0.6
+
+# Seconds before detection is retried for a window size where the chat panel wasn't found
+CHAT_DETECTION_RETRY_INTERVAL = 30
+
+# Minimum normalised correlation for a chat tab template match to be accepted
+CHAT_TEMPLATE_MATCH_THRESHOLD = 0.8
+
+# Accepted width/height ratio and minimum area for a chat panel found by border detection
+CHAT_PANEL_ASPECT_RANGE = (2.5, 6.0)
+CHAT_PANEL_MIN_AREA = 20000
+
+
+class FrameBufferRing:
+    """
+    Small ring of preallocated frame buffers.
+
+    Each capture writes into the next buffer in the ring, so a frame stays valid until buffer_count more
+    captures have been made. Stages that may hold a frame longer than that, such as OCR, must copy it.
+    """
+
+    def __init__(self, buffer_count):
+        self.buffer_count = buffer_count
+        self.buffers = []
+        self.index = 0
+
+    def next(self, shape):
+        if not self.buffers or self.buffers[0].shape != shape:
+            self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(self.buffer_count)]
+        buffer = self.buffers[self.index]
+        self.index = (self.index + 1) % self.buffer_count
+        return buffer
+
+
+class MssCapture:
+    """
+    Capture backend that grabs screen regions with mss straight into reusable buffers
+    """
+
+    name = 'mss'
+
+    def __init__(self, buffer_count=5):
+        if mss is None:
+            raise ImportError("mss is not installed")
+        self.ring = FrameBufferRing(buffer_count)
+        self.local = threading.local()  # mss handles can't be shared between threads
+
+    def grab(self, region, colour=False):
+        """
+        Returns a grayscale (or BGR when colour is set) image of the (x, y, width, height) screen region
+        """
+        screen = getattr(self.local, 'screen', None)
+        if screen is None:
+            screen = self.local.screen = mss.mss()
+        x, y, width, height = region
+        shot = screen.grab({'left': x, 'top': y, 'width': width, 'height': height})
+        # View the raw BGRA bytes without copying and convert them straight into a ring buffer
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        if colour:
+            return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self.ring.next((shot.height, shot.width, 3)))
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY, dst=self.ring.next((shot.height, shot.width)))
+
+
+class PyautoguiCapture:
+    """
+    Capture backend that grabs screen regions with pyautogui screenshots
+    """
+
+    name = 'pyautogui'
+
+    def grab(self, region, colour=False):
+        """
+        Returns a grayscale (or BGR when colour is set) image of the (x, y, width, height) screen region
+        """
+        screenshot = pyautogui.screenshot(region=region)
+        if colour:
+            return cv2.cvtColor(np.asarray(screenshot), cv2.COLOR_RGB2BGR)
+        return np.asarray(screenshot.convert('L'))
+
+
+def create_capture_backend(name='auto', buffer_count=5):
+    """
+    Creates the requested capture backend ('auto', 'mss' or 'pyautogui').
+
+    'auto' prefers mss and falls back to pyautogui.
+    """
+    if name in ('auto', 'mss'):
+        try:
+            return MssCapture(buffer_count)
+        except Exception as e:
+            if name == 'mss':
+                raise
+            logger.warning(f"Falling back to pyautogui, mss is unavailable: {str(e)}")
+    if name in ('auto', 'pyautogui'):
+        return PyautoguiCapture()
+    raise ValueError(f"Unknown capture backend: {name}")
+
+
+class ChatRegionDetector:
+    """
+    Finds the chat panel inside the game window and caches its bounding box per window size.
+
+    The cached box is stored relative to the window, so moving the window only shifts the
+    capture region; detection runs again only when the window is resized. A failed detection is
+    cached too, and only retried after retry_interval seconds or once the window is resized.
+    """
+
+    def __init__(self, window_title, capture, template_path=None, retry_interval=CHAT_DETECTION_RETRY_INTERVAL):
+        self.window_title = window_title
+        self.capture = capture
+        self.retry_interval = retry_interval
+        self.template = None
+        if template_path and os.path.exists(template_path):
+            self.template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+        self.cache = {}  # (width, height) -> (x, y, width, height) relative to the window
+        self.misses = {}  # (width, height) -> time detection last failed
+
+    def get_window_geometry(self):
+        """
+        Returns the (left, top, width, height) of the game window, or None if it is not open
+        """
+        windows = gw.getWindowsWithTitle(self.window_title)
+        if not windows:
+            return None
+        window = windows[0]
+        return window.left, window.top, window.width, window.height
+
+    def match_template(self, grayscale):
+        """
+        Locates the chat tab strip and returns the chat lines area above it
+        """
+        if self.template is None:
+            return None
+        template_height, template_width = self.template.shape[:2]
+        if grayscale.shape[0] < template_height or grayscale.shape[1] < template_width:
+            return None
+        result = cv2.matchTemplate(grayscale, self.template, cv2.TM_CCOEFF_NORMED)
+        _, max_value, _, (x, y) = cv2.minMaxLoc(result)
+        if max_value < CHAT_TEMPLATE_MATCH_THRESHOLD:
+            return None
+        top = y - self.lines_height_above(grayscale, x, y, template_width)
+        return x, top, template_width, y - top
+
+    def lines_height_above(self, grayscale, x, y, width):
+        """
+        Returns the height of the chat lines area above the tab strip at (x, y): up to the panel's top border
+        when it can be found, or else estimated from the strip's width
+        """
+        estimate = min(y, int(round(width / CHAT_LINES_ASPECT_RATIO)))
+        search_top = max(0, y - 2 * estimate)
+        area = grayscale[search_top:y, x:x + width]
+        if area.size == 0:
+            return estimate
+
+        # The top border is a horizontal edge across most of the strip's width, near the estimated height
+        coverage = (cv2.Canny(area, 50, 150) > 0).mean(axis=1)
+        heights = y - (search_top + np.flatnonzero(coverage >= CHAT_BORDER_MIN_COVERAGE))
+        heights = heights[heights >= estimate // 2]
+        if len(heights) == 0:
+            return estimate
+        return int(heights[np.argmin(np.abs(heights - estimate))])
+
+    def find_panel_border(self, grayscale):
+        """
+        Looks for the chat panel's rectangular border in the lower left quarter of the window
+        """
+        height, width = grayscale.shape[:2]
+        offset_y = height // 2
+        search_area = grayscale[offset_y:, :width // 2 + width // 4]
+        edges = cv2.Canny(search_area, 50, 150)
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        best_box = None
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if h == 0 or w * h < CHAT_PANEL_MIN_AREA:
+                continue
+            if not CHAT_PANEL_ASPECT_RANGE[0] <= w / h <= CHAT_PANEL_ASPECT_RANGE[1]:
+                continue
+            if best_box is None or w * h > best_box[2] * best_box[3]:
+                best_box = (x, y + offset_y, w, h)
+        return best_box
+
+    def detect(self, grayscale):
+        """
+        Returns the chat panel bounding box relative to the grayscale window image, or None if not found
+        """
+        return self.match_template(grayscale) or self.find_panel_border(grayscale)
+
+    def get_region(self):
+        """
+        Returns the absolute (x, y, width, height) screen region of the chat panel, or None
+        """
+        try:
+            geometry = self.get_window_geometry()
+            if geometry is None:
+                return None
+            left, top, width, height = geometry
+
+            if (width, height) not in self.cache:
+                # Don't repeat a failed detection on every frame, it costs more than capturing the whole window
+                failed_at = self.misses.get((width, height))
+                if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+                    return None
+                box = self.detect(self.capture.grab(geometry))
+                if box is None:
+                    logger.warning(f"Could not locate the chat panel in the game window, "
+                                   f"retrying in {self.retry_interval} seconds")
+                    self.misses[(width, height)] = time.monotonic()
+                    return None
+                logger.info(f"Detected chat panel at {box} for window size {width}x{height}")
+                self.misses.pop((width, height), None)
+                self.cache[(width, height)] = box
+
+            x, y, box_width, box_height = self.cache[(width, height)]
+            return left + x, top + y, box_width, box_height
+        except Exception as e:
+            logger.error(f"An error occurred while detecting the chat region: {str(e)}")
+            return None
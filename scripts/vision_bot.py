@@ -1,35 +1,144 @@
 import cv2
-import numpy as np
 import pygetwindow as gw
-import pyautogui
 import time
 import pytesseract
 import openai
 from pynput.keyboard import Controller, Key
-import random
 import logging
-import re
-from typing import List, Tuple
 import datetime
+import functools
+import os
+import queue
+import sys
+import threading
 from collections import deque
+from screen_capture import ChatRegionDetector, create_capture_backend
+from chat_ocr import (CHAT_CHANNEL_COLOURS, LineTextCache, OCREnginePool, create_ocr_engine, extract_text,
+                      frame_changed, frame_signature, process_player_messages)
+from chat_history import ChatLineTracker, ContextBuilder, ReplyIndex, is_ocr_garbage, vary_reply
+
+# Make the shared modules in the repository root importable when running from the scripts folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from llm_client import LLMCancelled, create_llm_client
 
 # Set up OpenAI API credentials
 openai.api_key = '<your-openai-api-key>'
 
+# Set the timeout in seconds for each response request
+REQUEST_TIMEOUT = 30
+
+# Select the LLM backend ('openai', 'local' for an OpenAI-compatible endpoint at LLM_API_BASE, or 'mock' for an
+# offline stand-in with MOCK_LATENCY seconds of latency and MOCK_ERROR_RATE of requests failing)
+LLM_BACKEND = 'openai'
+LLM_API_BASE = 'http://localhost:8000/v1'
+MOCK_LATENCY = 0.5
+MOCK_ERROR_RATE = 0.0
+
+# Set how often in seconds a summary of LLM latency, token usage and errors is logged
+METRICS_INTERVAL = 300
+
+# Set the token budget of each reply request, shared by the system prompt, the message and its chat context,
+# and the number of recent chat lines considered for the context
+CONTEXT_TOKEN_BUDGET = 250
+CONTEXT_MAX_LINES = 20
+
+# Set how similar (cosine similarity of character n-grams, 0 to 1) a message must be to one answered recently for its
+# reply to be reused instead of requesting a new one, how many replies are kept, and how often each can be reused
+REPLY_REUSE_THRESHOLD = 0.85
+REPLY_INDEX_SIZE = 256
+REPLY_MAX_REUSE = 3
+
 # Set up Tesseract OCR path (replace with your Tesseract installation path)
 pytesseract.pytesseract.tesseract_cmd = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
 
+# Select the OCR engine ('auto' keeps one Tesseract instance loaded via tesserocr when available,
+# 'glyph' matches the game's bitmap font against the glyph atlas and uses Tesseract for lines it can't read)
+OCR_ENGINE = 'auto'
+TESSDATA_PATH = 'C:\\Program Files\\Tesseract-OCR\\tessdata'
+GLYPH_ATLAS_PATH = 'glyph_atlas.npz'
+
+# Number of recognized chat line strips kept in the OCR cache
+LINE_CACHE_SIZE = 512
+
+# Number of OCR worker threads for recognizing new chat lines in parallel (1 keeps OCR serial)
+OCR_WORKERS = min(4, os.cpu_count() or 1)
+
+# Define the chat channels to read (see CHAT_CHANNEL_COLOURS in chat_ocr). Only pixels in their text colours are
+# sent to OCR; leave CHAT_CHANNELS empty to read the whole chat box in grayscale
+CHAT_CHANNELS = []
+CHAT_COLOUR_TOLERANCE = 40  # Maximum difference per colour component for a pixel to count as text
+CHAT_UPSCALE = 2  # Integer factor applied to isolated glyphs before OCR
+
+# Select the screen capture backend ('auto' grabs into reusable buffers via mss when available)
+CAPTURE_BACKEND = 'auto'
+
 # Define screen capture coordinates
 SCREEN_WIDTH = 3896
 SCREEN_HEIGHT = 2160
 SCREEN_REGION = (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
 
-# Define chat input coordinates
+# Define chat input coordinates (used as a fallback when the chat panel can't be detected)
 CHAT_INPUT_X = 1000
 CHAT_INPUT_Y = 1800
 
+# Define the game window title and an optional image of the chat tab strip used to find the chat panel
+WINDOW_TITLE = 'RuneScape'
+CHAT_TAB_TEMPLATE_PATH = 'chat_tabs.png'
+
+# Define frame change detection settings
+# Frames are compared as small grayscale thumbnails; a frame counts as changed when any thumbnail
+# row differs from the previous frame by more than the threshold (mean absolute grey-level difference)
+FRAME_SIGNATURE_SIZE = (64, 64)
+FRAME_CHANGE_THRESHOLD = 4.0
+
+# Define pipeline settings
+CAPTURE_INTERVAL = 1  # Seconds between screen captures
+RESPONSE_COOLDOWN = 10  # Minimum seconds between bot responses
+FRAME_QUEUE_SIZE = 2  # Frames waiting for OCR; the oldest is dropped when OCR falls behind
+MESSAGE_QUEUE_SIZE = 5  # New player messages waiting for the responder
+QUEUE_POLL_INTERVAL = 0.1  # Seconds a stage waits on its input queue before checking for shutdown
+
+# Define the event used to stop the pipeline stages
+stop_event = threading.Event()
+
+# Define the LLM client, which keeps one pooled HTTP session for every request
+llm_client = create_llm_client(LLM_BACKEND, REQUEST_TIMEOUT, openai.api_key, LLM_API_BASE, MOCK_LATENCY,
+                               MOCK_ERROR_RATE)
+llm_client.metrics.start_reporter(METRICS_INTERVAL)
+
 # Define the conversation history
-conversation_history = deque(maxlen=3)  # Limit the conversation history to the three most recent messages
+conversation_history = deque(maxlen=CONTEXT_MAX_LINES)
+
+# Define the builder that fits the conversation history into the reply's token budget
+context_builder = ContextBuilder(CONTEXT_TOKEN_BUDGET)
+
+# Define the index of recent replies, reused for messages similar to ones already answered
+reply_index = ReplyIndex(REPLY_INDEX_SIZE, REPLY_REUSE_THRESHOLD, max_reuse=REPLY_MAX_REUSE)
+
+# Define the chat line tracker, which only reports lines that weren't visible in earlier frames
+chat_tracker = ChatLineTracker(window_size=200, similarity_threshold=0.9, history=conversation_history)
+
+# Define the screen capture backend; frames sent to OCR are copied, so its buffers only have to outlive the preview
+screen_capture = create_capture_backend(CAPTURE_BACKEND, buffer_count=3)
+
+# Define the text colours of the selected chat channels
+channel_colours = [colour for channel in CHAT_CHANNELS for colour in CHAT_CHANNEL_COLOURS[channel]]
+
+# Define the chat panel detector
+chat_region_detector = ChatRegionDetector(WINDOW_TITLE, screen_capture, CHAT_TAB_TEMPLATE_PATH)
+
+# Define the OCR engine, loaded once for the life of the bot; glyphs are upscaled along with isolated chat channels
+glyph_scale = CHAT_UPSCALE if CHAT_CHANNELS else 1
+ocr_engine = create_ocr_engine(OCR_ENGINE, TESSDATA_PATH, atlas_path=GLYPH_ATLAS_PATH, scale=glyph_scale)
+
+# Define the cache of recognized chat lines, so rows that only scrolled aren't OCR'd again
+line_cache = LineTextCache(LINE_CACHE_SIZE)
+
+# Define the pool of OCR engines used when several new chat lines arrive at once
+ocr_pool = None
+if OCR_WORKERS > 1:
+    ocr_pool = OCREnginePool(functools.partial(create_ocr_engine, OCR_ENGINE, TESSDATA_PATH,
+                                               atlas_path=GLYPH_ATLAS_PATH, scale=glyph_scale), OCR_WORKERS)
 
 # Define keyboard controller
 keyboard = Controller()
@@ -65,32 +174,21 @@ def type_message(message):
 # Function to capture the screen using video capture
 def capture_screen():
     try:
-        # Calculate the screen capture region based on chat input coordinates
-        x1 = max(0, CHAT_INPUT_X - 1000)
-        y1 = max(0, CHAT_INPUT_Y - 1000)
-        x2 = min(SCREEN_WIDTH, CHAT_INPUT_X + 1000)
-        y2 = min(SCREEN_HEIGHT, CHAT_INPUT_Y + 2000)
-        
-        # Capture the screen region
-        screenshot = pyautogui.screenshot(region=(x1, y1, x2 - x1, y2 - y1))
-        captured_region = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-        return captured_region
+        # Use the detected chat panel, falling back to a region around the chat input coordinates
+        region = chat_region_detector.get_region()
+        if region is None:
+            x1 = max(0, CHAT_INPUT_X - 1000)
+            y1 = max(0, CHAT_INPUT_Y - 1000)
+            x2 = min(SCREEN_WIDTH, CHAT_INPUT_X + 1000)
+            y2 = min(SCREEN_HEIGHT, CHAT_INPUT_Y + 2000)
+            region = (x1, y1, x2 - x1, y2 - y1)
+
+        # Capture the screen region, in colour only when chat channels are isolated by colour
+        return screen_capture.grab(region, colour=bool(channel_colours))
     except Exception as e:
         logger.error(f"An error occurred while capturing the screen: {str(e)}")
         return None
 
-# Function to extract text from an image using Tesseract OCR
-def extract_text(image):
-    try:
-        grayscale = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        # Perform preprocessing on the grayscale image if needed (e.g., thresholding, denoising, etc.)
-        # Extract text using Tesseract OCR
-        text = pytesseract.image_to_string(grayscale)
-        return text
-    except Exception as e:
-        logger.error(f"An error occurred while extracting text from image: {str(e)}")
-        return ''
-
 # Function to send a message to the game
 def send_message(message):
     try:
@@ -103,7 +201,7 @@ def send_message(message):
             truncated_message = ' '.join(words[:15])
             logger.info(f"Truncated message to 15 words: {truncated_message}")
             # Switch focus to the RuneScape window
-            window = gw.getWindowsWithTitle('RuneScape')[0]
+            window = gw.getWindowsWithTitle(WINDOW_TITLE)[0]
             window.activate()
             time.sleep(0.5)
 
@@ -118,7 +216,7 @@ def send_message(message):
             # The message fits within the limit, send it normally
             logger.info(f"Sending message: {message}")
             # Switch focus to the RuneScape window
-            window = gw.getWindowsWithTitle('RuneScape')[0]
+            window = gw.getWindowsWithTitle(WINDOW_TITLE)[0]
             window.activate()
             time.sleep(0.5)
 
@@ -132,23 +230,11 @@ def send_message(message):
     except Exception as e:
         logger.error(f"An error occurred while sending the message: {str(e)}")
 
-# Function to process player messages
-def process_player_messages(text: str) -> List[Tuple[str, str]]:
-    lines = text.split('\n')
-    player_messages = []
-    pattern = re.compile(r'^(\w+):\s*(.*)$')  # Assumes username contains only word characters
-    for line in lines:
-        match = pattern.match(line)
-        if match:
-            name = match.group(1)
-            message = match.group(2)
-            player_messages.append((name, message))
-    return player_messages  # Reverse the order of player messages
-
 # Function to generate a response using GPT-3.5-turbo
 def generate_message(user_prompt, system_prompt):
     try:
-        response = openai.ChatCompletion.create(
+        response = llm_client.create(
+            stop_event=stop_event,
             model="gpt-3.5-turbo",  # Use GPT-3.5-turbo
             messages=[
                 {
@@ -170,87 +256,176 @@ def generate_message(user_prompt, system_prompt):
         truncated_response = bot_response[:70]
         
         return truncated_response
+    except LLMCancelled:
+        logger.info("Response generation cancelled because the bot is stopping")
+        return None
     except Exception as e:
         logger.error(f"An error occurred while generating the response: {str(e)}")
         return None
 
-# Main bot loop
-def run_bot():
-    last_message_time = time.time()
-    is_bot_typing = False  # Track whether the bot is currently typing a response
+# Function to put an item on a bounded queue, dropping the oldest item when the queue is full
+def put_latest(item_queue, item):
     while True:
         try:
-            # Capture the screen and extract text
+            item_queue.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                item_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+# Capture stage: grabs the chat region and forwards frames that changed to the OCR stage
+def capture_loop(frame_queue, preview_queue):
+    previous_signature = None  # Signature of the last frame that was sent to OCR
+    while not stop_event.is_set():
+        try:
             screenshot = capture_screen()
 
             if screenshot is not None:
-                # Show the captured screen
-                cv2.imshow('Screen', screenshot)
-                cv2.waitKey(1)  # Required for OpenCV to update the window
-
-                text = extract_text(screenshot)
-                logger.info(f"Extracted text: {text}")
-
-                # Process player messages
-                player_messages = process_player_messages(text)
-
-                if player_messages:
-                    # Select the last player message
-                    name, message = player_messages[-1]
-
-                    if name == "GEwhisperer":
-                        continue  # Skip processing the message
-
-                    # Combine the message history and current message as context
-                    context = '\n'.join([f"{name}: {message}" for name, message in player_messages])
-                    user_prompt = f"{context}\n{name}: {message}"
-                    system_prompt = "You're a regular RuneScape player, you make super short funny comments in conversation in under 70 characters. Never ever mention that you are an AI model, or an AI at all, no exceptions! If you can't find a relevant response, ask a question to ignite conversation. Without exception, respond in under 70 characters. Without exception, always respond in a full sentence. Do not use hashtags or proper grammar. Do not use emojis. Less is more here. Here is the message from the user that you will respond to:"
-
-                    if is_bot_typing:
-                        # Wait for the bot to finish typing before generating a new response
-                        time.sleep(2)
-                        is_bot_typing = False
+                put_latest(preview_queue, screenshot)
+
+                # Skip OCR and parsing while the chat box is unchanged
+                signature = frame_signature(screenshot, FRAME_SIGNATURE_SIZE)
+                if frame_changed(signature, previous_signature, FRAME_CHANGE_THRESHOLD):
+                    previous_signature = signature
+                    # The capture buffer is reused a few captures later, so OCR gets its own copy of the chat region
+                    put_latest(frame_queue, screenshot.copy())
+                else:
+                    logger.debug("Chat region unchanged, skipping OCR")
+        except Exception as e:
+            logger.error(f"An error occurred in the capture stage: {str(e)}")
 
-                    response = generate_message(user_prompt, system_prompt)
+        # Wait before capturing the screen again to prevent rapid screenshotting
+        stop_event.wait(CAPTURE_INTERVAL)
 
-                    if response:
-                        logger.info(f"Player message: {name}: {message}")  # Log the player message
+# OCR stage: extracts and parses chat lines and forwards new player messages to the responder
+def ocr_loop(frame_queue, message_queue):
+    while not stop_event.is_set():
+        try:
+            screenshot = frame_queue.get(timeout=QUEUE_POLL_INTERVAL)
+        except queue.Empty:
+            continue
 
-                        # Delay the bot's response to simulate typing
-                        typing_delay = random.uniform(1, 2)
-                        logger.info(f"Typing response: {response}")
-                        logger.info(f"Bot is typing for {typing_delay:.2f} seconds")
-                        is_bot_typing = True
+        try:
+            text = extract_text(screenshot, ocr_engine, line_cache, ocr_pool, channel_colours, CHAT_COLOUR_TOLERANCE,
+                                CHAT_UPSCALE)
+            logger.info(f"Extracted text: {text}")
+
+            # Process player messages, keeping only lines that weren't already on screen in an earlier frame
+            player_messages = process_player_messages(text)
+            new_messages = chat_tracker.update(player_messages)
+
+            for name, message, context in new_messages:
+                if name == "GEwhisperer":
+                    continue  # Skip processing the message
+                if is_ocr_garbage(message):
+                    logger.debug(f"Skipping unreadable chat line: {name}: {message}")
+                    continue
+
+                # The context is the message history as it was when the message arrived
+                put_latest(message_queue, (name, message, context))
+        except Exception as e:
+            logger.error(f"An error occurred in the OCR stage: {str(e)}")
 
-                        # Send the response as a message in the game
-                        send_message(response)
-                        # Update the last message time
-                        last_message_time = time.time()
+# Function to take the most recent message from the queue, discarding older ones
+def get_latest(item_queue, item):
+    while True:
+        try:
+            item = item_queue.get_nowait()
+        except queue.Empty:
+            return item
 
-                # Clear the conversation history
-                player_messages.clear()
+# Function to show the most recent captured frame (OpenCV windows must be updated from the main thread)
+def show_preview(preview_queue):
+    try:
+        screenshot = preview_queue.get_nowait()
+    except queue.Empty:
+        return
+    cv2.imshow('Screen', screenshot)
+    cv2.waitKey(1)  # Required for OpenCV to update the window
+
+# Responder stage: answers the latest new player message, at most once per response cooldown
+def respond_loop(message_queue, preview_queue):
+    last_message_time = 0
+    system_prompt = "You're a regular RuneScape player, you make super short funny comments in conversation in under 70 characters. Never ever mention that you are an AI model, or an AI at all, no exceptions! If you can't find a relevant response, ask a question to ignite conversation. Without exception, respond in under 70 characters. Without exception, always respond in a full sentence. Do not use hashtags or proper grammar. Do not use emojis. Less is more here. Here is the message from the user that you will respond to:"
+    while not stop_event.is_set():
+        try:
+            show_preview(preview_queue)
+            try:
+                item = message_queue.get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
 
-            # Sleep for a random duration
-            sleep_time = random.uniform(10, 10)
+            # Wait out the cooldown, then answer whichever message is newest by then
             elapsed_time = time.time() - last_message_time
-            if elapsed_time < sleep_time:
-                logger.info(f"Sleeping for {sleep_time - elapsed_time:.2f} seconds")
-                time.sleep(sleep_time - elapsed_time)
-
-        except KeyboardInterrupt:
-            logger.info("Program terminated by user")
-            break
+            if elapsed_time < RESPONSE_COOLDOWN:
+                logger.info(f"Sleeping for {RESPONSE_COOLDOWN - elapsed_time:.2f} seconds")
+                while time.time() - last_message_time < RESPONSE_COOLDOWN and not stop_event.is_set():
+                    show_preview(preview_queue)
+                    time.sleep(QUEUE_POLL_INTERVAL)
+            name, message, context = get_latest(message_queue, item)
+
+            # Answer messages like ones answered recently with a variation of the same reply, skipping the API
+            response = reply_index.lookup(message)
+            if response is not None:
+                response = vary_reply(response)
+                logger.info("Reusing the reply to a similar message")
+            else:
+                user_prompt = context_builder.build(context, name, message, system_prompt)
+                logger.debug(f"Prompt uses {context_builder.counter.count(system_prompt + user_prompt)} "
+                             f"of {CONTEXT_TOKEN_BUDGET} tokens")
+
+                response = generate_message(user_prompt, system_prompt)
+                if response:
+                    reply_index.add(message, response)
+
+            if response and not stop_event.is_set():
+                logger.info(f"Player message: {name}: {message}")  # Log the player message
+                logger.info(f"Typing response: {response}")
+
+                # Send the response as a message in the game
+                send_message(response)
+                # Update the last message time
+                last_message_time = time.time()
         except Exception as e:
             logger.error(f"An unexpected error occurred: {str(e)}")
-            time.sleep(10)  # Wait a bit before the next iteration to prevent rapid-fire error messages
+            stop_event.wait(10)  # Wait a bit before the next iteration to prevent rapid-fire error messages
 
-        # Sleep after capturing the screen to prevent rapid screenshotting
-        time.sleep(1)
+# Main bot loop: runs capture and OCR in background threads and responds from the main thread
+def run_bot():
+    stop_event.clear()
+    frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    message_queue = queue.Queue(maxsize=MESSAGE_QUEUE_SIZE)
+    preview_queue = queue.Queue(maxsize=1)
+
+    stages = [
+        threading.Thread(target=capture_loop, args=(frame_queue, preview_queue), name='capture', daemon=True),
+        threading.Thread(target=ocr_loop, args=(frame_queue, message_queue), name='ocr', daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    try:
+        respond_loop(message_queue, preview_queue)
+    except KeyboardInterrupt:
+        logger.info("Program terminated by user")
+    finally:
+        stop_event.set()
+        for stage in stages:
+            stage.join(timeout=5)
 
     # Release the keyboard
     keyboard.release(CHAT_HOTKEY)
     # Close the OpenCV windows
     cv2.destroyAllWindows()
+    # Close the LLM client's HTTP session
+    llm_client.close()
+    # Release the OCR engines
+    ocr_engine.close()
+    if ocr_pool is not None:
+        ocr_pool.close()
 
 # Call the main function to start the bot
-run_bot()
\ No newline at end of file
+if __name__ == '__main__':
+    run_bot()